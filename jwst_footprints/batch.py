@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Footprints for a whole table of pointings, computed on a pool of processes.
+
+The pointing table is any table astropy can read with a header line, with
+the columns
+
+    ra, dec     pointing of the NIRSpec MSA and of NIRCam (degrees or
+                hh mm ss.sss  dd mm ss.sss strings)
+    pa          aperture position angle, degrees
+    name        optional, names the output of the pointing (default: row number)
+    dither      optional NIRCam dither pattern (default: None)
+    mosaic      optional Yes / No (default: No)
+    off_v2      optional NIRCam mosaic offsets, arcsec (default: 0)
+    off_v3
+
+Each pointing produces either one .npz file with the vertices of every
+footprint (format 'npz'), or a directory of DS9 region files on a given
+image (format 'regions'), or in degrees with no image (format 'regions'
+with a sky coordinate system, fk5 or icrs).
+
+    $ jwst_footprints_batch pointings.txt -o out/ -j 8
+    $ jwst_footprints_batch pointings.txt -o out/ --format regions --image mosaic.fits
+    $ jwst_footprints_batch pointings.txt -o out/ --format regions --coordsys fk5
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import ascii
+
+from .footprints import (SKY_COORDSYS, compute_footprints, create_footprint_regions,
+                         load_apertures, region_coordsys)
+from .images import image_wcs
+
+INSTRUMENTS = ('msa', 'long', 'short')
+
+# per process: WCS of the images the region files are drawn on, read on
+# first use, by (inputfile, ext)
+_imagewcs = {}
+
+
+def read_pointings(filename):
+    '''Pointing table as a list of dicts, one per pointing'''
+    table = ascii.read(filename)
+    for col in ('ra', 'dec', 'pa'):
+        if col not in table.colnames:
+            raise ValueError('{}: missing column {}'.format(filename, col))
+
+    pointings = []
+    for i, row in enumerate(table):
+        pointing = dict(name=str(i), dither='None', mosaic='No',
+                        off_v2=0.0, off_v3=0.0)
+        for col in table.colnames:
+            pointing[col] = row[col]
+        pointing['name'] = str(pointing['name'])
+        pointing['ra'] = str(pointing['ra'])
+        pointing['dec'] = str(pointing['dec'])
+        pointings.append(pointing)
+    return pointings
+
+
+def _region_wcs(inputfile, ext=None, coordsys='image'):
+    # WCS (or sky system) of the region files, the image read once per process
+    if coordsys != 'image':
+        # regions in degrees, no image
+        return coordsys
+    if (inputfile, ext) not in _imagewcs:
+        _imagewcs[(inputfile, ext)] = image_wcs(inputfile, ext)
+    return _imagewcs[(inputfile, ext)]
+
+
+def run_pointing(pointing, outdir, instruments=INSTRUMENTS, outformat='npz',
+                 colors=None, inputfile=None, ext=None, coordsys='image'):
+    '''Footprints of one pointing (a dict as from read_pointings()),
+    returns the name of the file or directory written. The region files
+    (outformat 'regions') are drawn on the image inputfile (HDU ext) or in
+    the sky system coordsys, as in run_batch().'''
+    plot = dict((name, 'Yes' if name in instruments else 'No') for name in INSTRUMENTS)
+    geometry = compute_footprints(plot['long'], plot['short'], plot['msa'],
+                                  pointing['ra'], pointing['dec'], float(pointing['pa']),
+                                  str(pointing['dither']),
+                                  pointing['ra'], pointing['dec'], float(pointing['pa']),
+                                  str(pointing['mosaic']),
+                                  float(pointing['off_v2']), float(pointing['off_v3']),
+                                  verbose=False)
+
+    if outformat == 'regions':
+        regiondir = os.path.join(outdir, pointing['name'])
+        if not os.path.exists(regiondir):
+            os.makedirs(regiondir, mode=0o0755)
+        create_footprint_regions(geometry, regiondir, _region_wcs(inputfile, ext, coordsys),
+                                 **(colors or {}))
+        return regiondir
+
+    output = os.path.join(outdir, pointing['name'] + '.npz')
+    arrays = {}
+    for name, fp in geometry.items():
+        arrays[name + '_ra'] = fp['ra']
+        arrays[name + '_dec'] = fp['dec']
+        arrays[name + '_centre'] = np.array(fp['centre'])
+    np.savez(output, **arrays)
+    return output
+
+
+def _run_pointing(args):
+    return run_pointing(*args)
+
+
+def run_batch(pointings, outdir, instruments=INSTRUMENTS, outformat='npz',
+              inputfile=None, max_workers=None, chunksize=64, colors=None, ext=None,
+              coordsys='image'):
+    '''Footprints of every pointing, spread over a pool of max_workers
+    processes (default: one per core). pointings is a pointing table file
+    name or a list of dicts as from read_pointings(). outformat 'regions'
+    needs the image inputfile the regions are drawn on (HDU ext, by default
+    the first one with a celestial WCS), unless coordsys is 'fk5' or 'icrs'
+    for regions in degrees.
+    Returns the list of outputs, in the order of the pointings.'''
+    if outformat not in ('npz', 'regions'):
+        raise ValueError('unknown output format {}'.format(outformat))
+    if coordsys != 'image':
+        region_coordsys(coordsys)
+    elif outformat == 'regions' and inputfile is None:
+        raise ValueError('region files in image coordinates need an image (inputfile)')
+    if isinstance(pointings, str):
+        pointings = read_pointings(pointings)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir, mode=0o0755)
+
+    # read the templates before forking so that the workers share them
+    # (spawned workers read them on first use)
+    load_apertures()
+    tasks = [(pointing, outdir, instruments, outformat, colors, inputfile, ext, coordsys)
+             for pointing in pointings]
+    # no pool initializer, which needs Python 3.7: the workers read the image
+    # WCS in run_pointing()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_run_pointing, tasks, chunksize=chunksize))
+
+
+def _extension(ext):
+    # HDU number or EXTNAME from the command line
+    if ext is None or not ext.isdigit():
+        return ext
+    return int(ext)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='JWST NIRSpec / NIRCam footprints for a table of pointings')
+    parser.add_argument('pointings', help='table with columns ra dec pa [name dither mosaic off_v2 off_v3]')
+    parser.add_argument('-o', '--outdir', default='.', help='output directory')
+    parser.add_argument('-i', '--instruments', nargs='+', default=list(INSTRUMENTS),
+                        choices=INSTRUMENTS, help='footprints to compute')
+    parser.add_argument('-f', '--format', default='npz', choices=('npz', 'regions'),
+                        help='one .npz file or one set of DS9 region files per pointing')
+    parser.add_argument('--image', default=None, help='FITS image the region files are drawn on')
+    parser.add_argument('--coordsys', default='image', choices=('image',) + SKY_COORDSYS,
+                        help='region coordinates: image pixels (needs --image) or degrees')
+    parser.add_argument('--ext', default=None,
+                        help='HDU of the image, number or EXTNAME (default: first with a celestial WCS)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of processes (default: one per core)')
+    args = parser.parse_args(argv)
+    if args.format == 'regions' and args.coordsys == 'image' and args.image is None:
+        parser.error('--format regions needs --image, or --coordsys fk5 / icrs')
+
+    outputs = run_batch(args.pointings, args.outdir, args.instruments, args.format,
+                        args.image, args.jobs, ext=_extension(args.ext),
+                        coordsys=args.coordsys)
+    print('{} pointings written to {}'.format(len(outputs), args.outdir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Source catalogs (.radec files) read in chunks of a fixed number of rows.
+
+A catalog has one source per line, whitespace or comma separated:
+
+    ra  dec              (degrees)
+    ra  dec  type        (type P = primary source, F = filler)
+
+Lines starting with # and blank lines are skipped. Reading a chunk at a
+time keeps the memory use fixed whatever the size of the catalog.
+
+load_catalog() keeps a binary copy of a catalog under CONFIG_DIR/catalogs,
+as .npy columns (ra, dec, source type codes and unit vectors) that later
+runs map from disk instead of parsing the text again. The copy is rebuilt
+when the size or modification time of the catalog changes; clear_cache()
+removes it (about 44 bytes per source).
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import json
+import os
+import shutil
+from itertools import islice
+
+import numpy as np
+
+from . import CONFIG_DIR
+
+# rows per chunk
+CHUNKSIZE = 200000
+
+CACHE_DIR = os.path.join(CONFIG_DIR, 'catalogs')
+
+
+def _data_lines(fp):
+    for line in fp:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            # commas separate the columns as well as whitespace
+            yield line.replace(',', ' ')
+
+
+def catalog_columns(filename):
+    '''Number of columns of a catalog (0 if it has no data)'''
+    with open(filename, 'r') as fp:
+        for line in _data_lines(fp):
+            return len(line.split())
+    return 0
+
+
+def iter_catalog(filename, chunksize=CHUNKSIZE):
+    '''Read a catalog chunksize rows at a time
+
+    Yields (ra, dec, sourcetype) for each chunk: float64 arrays of ra and dec
+    in degrees and a string array of the source types, or None for a
+    2 column catalog. Columns after the third are ignored.'''
+    ncol = catalog_columns(filename)
+    if ncol < 2:
+        raise ValueError('{}: not a ra dec [type] catalog'.format(filename))
+
+    with open(filename, 'r') as fp:
+        lines = _data_lines(fp)
+        while True:
+            chunk = list(islice(lines, chunksize))
+            if not chunk:
+                break
+            # one split of the whole chunk, then a (nrow, ncol) table of strings
+            fields = ' '.join(chunk).split()
+            if len(fields) != len(chunk) * ncol:
+                raise ValueError('{}: every row must have {} columns'.format(filename, ncol))
+            table = np.array(fields).reshape(len(chunk), ncol)
+            ra = table[:, 0].astype(np.float64)
+            dec = table[:, 1].astype(np.float64)
+            if ncol >= 3:
+                sourcetype = table[:, 2]
+            else:
+                sourcetype = None
+            yield (ra, dec, sourcetype)
+
+
+def read_catalog(filename):
+    '''Whole catalog as (ra, dec, sourcetype), see iter_catalog()'''
+    ra = []
+    dec = []
+    sourcetype = []
+    for chunk in iter_catalog(filename):
+        ra.append(chunk[0])
+        dec.append(chunk[1])
+        sourcetype.append(chunk[2])
+    if not ra:
+        return (np.zeros(0), np.zeros(0), None)
+    if sourcetype[0] is None:
+        return (np.concatenate(ra), np.concatenate(dec), None)
+    return (np.concatenate(ra), np.concatenate(dec), np.concatenate(sourcetype))
+
+
+class Catalog(object):
+    '''Catalog mapped from the binary cache of load_catalog()
+
+    ra, dec : (n,) float64, degrees
+    code    : (n,) int32 index of the source type in types (3 column catalogs)
+    types   : list of the source type strings
+    xyz     : (n, 3) float64 unit vectors
+    The arrays are read-only memory maps.'''
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json'), 'r') as fp:
+            self.meta = json.load(fp)
+        self.filename = self.meta['path']
+        self.types = self.meta['types']
+        self.ncol = self.meta['ncol']
+        for name in ('ra', 'dec', 'code', 'xyz'):
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __repr__(self):
+        return '<Catalog %s: %d sources>' % (self.filename, len(self))
+
+    @property
+    def sourcetype(self):
+        '''Source type strings, None for a 2 column catalog'''
+        if self.ncol < 3:
+            return None
+        return np.array(self.types)[self.code]
+
+    def chunks(self, chunksize=CHUNKSIZE):
+        '''(ra, dec, sourcetype) chunks as from iter_catalog()'''
+        types = np.array(self.types)
+        for start in range(0, len(self), chunksize):
+            stop = start + chunksize
+            if self.ncol < 3:
+                sourcetype = None
+            else:
+                sourcetype = types[self.code[start:stop]]
+            yield (np.asarray(self.ra[start:stop]), np.asarray(self.dec[start:stop]), sourcetype)
+
+
+def _cache_dir(filename):
+    path = os.path.abspath(filename)
+    return os.path.join(CACHE_DIR, hashlib.sha1(path.encode('utf-8')).hexdigest()[:16])
+
+
+def _cache_valid(directory, filename):
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as fp:
+            meta = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return False
+    st = os.stat(filename)
+    return (meta['path'] == os.path.abspath(filename) and
+            meta['size'] == st.st_size and meta['mtime'] == st.st_mtime_ns)
+
+
+def _build_cache(filename, directory, chunksize):
+    st = os.stat(filename)
+    ncol = catalog_columns(filename)
+    with open(filename, 'r') as fp:
+        nrows = sum(1 for line in _data_lines(fp))
+
+    tmpdir = directory + '.tmp-%d' % os.getpid()
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir, mode=0o0755)
+    try:
+        types = _write_columns(filename, tmpdir, nrows, chunksize)
+        meta = dict(path=os.path.abspath(filename), size=st.st_size, mtime=st.st_mtime_ns,
+                    ncol=ncol, nrows=nrows, types=types)
+        with open(os.path.join(tmpdir, 'meta.json'), 'w') as fp:
+            json.dump(meta, fp)
+    except Exception:
+        # no half-written copy left behind (bad row, disk full...)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(tmpdir, directory)
+
+
+def _write_columns(filename, tmpdir, nrows, chunksize):
+    # the .npy columns of the copy of a catalog, returns the source types
+    columns = {}
+    for name, dtype, shape in (('ra', np.float64, (nrows,)),
+                               ('dec', np.float64, (nrows,)),
+                               ('code', np.int32, (nrows,)),
+                               ('xyz', np.float64, (nrows, 3))):
+        columns[name] = np.lib.format.open_memmap(os.path.join(tmpdir, name + '.npy'),
+                                                  mode='w+', dtype=dtype, shape=shape)
+    types = []
+    start = 0
+    for ra, dec, sourcetype in iter_catalog(filename, chunksize):
+        stop = start + len(ra)
+        columns['ra'][start:stop] = ra
+        columns['dec'][start:stop] = dec
+        # footprints.unit(), written row-wise
+        rar = np.radians(ra)
+        decr = np.radians(dec)
+        columns['xyz'][start:stop, 0] = np.cos(rar) * np.cos(decr)
+        columns['xyz'][start:stop, 1] = np.sin(rar) * np.cos(decr)
+        columns['xyz'][start:stop, 2] = np.sin(decr)
+        if sourcetype is None:
+            columns['code'][start:stop] = 0
+        else:
+            # codes of this chunk -> codes of the whole catalog
+            names, inverse = np.unique(sourcetype, return_inverse=True)
+            for name in names:
+                if name not in types:
+                    types.append(str(name))
+            columns['code'][start:stop] = np.array([types.index(name) for name in names],
+                                                   np.int32)[inverse]
+        start = stop
+    for column in columns.values():
+        column.flush()
+    return types
+
+
+def clear_cache(filename=None):
+    '''Remove the binary copy of the catalog filename from CACHE_DIR, or of
+    every catalog (and any copy left half-written) if filename is None'''
+    if filename is not None:
+        shutil.rmtree(_cache_dir(filename), ignore_errors=True)
+    elif os.path.exists(CACHE_DIR):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def load_catalog(filename, chunksize=CHUNKSIZE):
+    '''Catalog (see Catalog) mapped from its binary copy in CACHE_DIR, which
+    is written first if missing or older than the catalog'''
+    if catalog_columns(filename) < 2:
+        raise ValueError('{}: not a ra dec [type] catalog'.format(filename))
+    directory = _cache_dir(filename)
+    if not _cache_valid(directory, filename):
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR, mode=0o0755)
+        _build_cache(filename, directory, chunksize)
+    return Catalog(directory)
+
+
+def catalog_chunks(filename, chunksize=CHUNKSIZE, cache='No'):
+    '''(ra, dec, sourcetype) chunks of a catalog: iter_catalog(), or with
+    cache == 'Yes' the chunks of the copy of load_catalog(), falling back to
+    the text file if the copy cannot be written'''
+    if cache == 'Yes':
+        try:
+            catalog = load_catalog(filename, chunksize)
+        except (IOError, OSError) as e:
+            print('cannot cache catalog ' + filename + ': ' + str(e))
+        else:
+            return catalog.chunks(chunksize)
+    return iter_catalog(filename, chunksize)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Coverage maps: the number of exposures (dither and mosaic positions) of the
+NIRCam and NIRSpec footprints that cover each pixel of an image.
+
+The footprint apertures are convex polygons on the image. They are filled
+by scanlines all at once: the extent in x of every aperture on every row it
+crosses comes out of one array operation over the polygon edges, each
+extent is marked at its ends in a difference image, and a cumulative sum
+along the rows gives the counts. A pixel is covered when its centre is
+inside the aperture.
+
+    geometry = compute_footprints(plot_long='Yes', plot_short='Yes',
+                                  dither_pattern_long='FULL6', ...)
+    counts = coverage_image('mosaic.fits', geometry, 'coverage.fits')
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+from astropy.io import fits
+
+from .footprints import world_to_pixel
+from .images import image_header, image_wcs
+
+
+def fill_polygons(x, y, counts):
+    '''Add 1 to the pixels of counts (ny, nx) whose centre is inside each
+    convex polygon of vertices x, y (n_polygon, n_vertex), in 1-based pixel
+    coordinates like the region files. Returns counts.'''
+    ny, nx = counts.shape
+    x = np.atleast_2d(np.asarray(x, np.float64))
+    y = np.atleast_2d(np.asarray(y, np.float64))
+    # polygons that do not project on the image plane (the other side of the sky)
+    finite = np.isfinite(x).all(axis=1) & np.isfinite(y).all(axis=1)
+    x, y = x[finite], y[finite]
+
+    # rows (0-based, centre at y = row + 1) spanned by each polygon, on the image
+    rowmin = np.clip(np.ceil(y.min(axis=1) - 1.0), 0, ny).astype(np.intp)
+    rowmax = np.clip(np.floor(y.max(axis=1) - 1.0), -1, ny - 1).astype(np.intp)
+    nrow = np.maximum(rowmax - rowmin + 1, 0)
+    if nrow.sum() == 0:
+        return counts
+    polygon = np.repeat(np.arange(len(x)), nrow)
+    row = np.arange(nrow.sum()) - np.repeat(np.cumsum(nrow) - nrow - rowmin, nrow)
+
+    # crossing of every row with every edge of its polygon
+    xa = x[polygon]
+    ya = y[polygon]
+    xb = np.roll(xa, -1, axis=1)
+    yb = np.roll(ya, -1, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = ((row + 1.0)[:, np.newaxis] - ya) / (yb - ya)
+        xc = xa + t * (xb - xa)
+    crosses = (t >= 0.0) & (t <= 1.0)
+    xmin = np.where(crosses, xc, np.inf).min(axis=1)
+    xmax = np.where(crosses, xc, -np.inf).max(axis=1)
+
+    # columns start:stop (0-based) with the pixel centre inside
+    start = np.clip(np.ceil(xmin - 1.0), 0, nx).astype(np.intp)
+    stop = np.clip(np.floor(xmax - 1.0) + 1, 0, nx).astype(np.intp)
+    inside = stop > start
+    if not inside.any():
+        return counts
+    row, start, stop = row[inside], start[inside], stop[inside]
+
+    # difference image over the rows and columns spanned, summed along the rows
+    first = row.min()
+    left = start.min()
+    right = stop.max()
+    diff = np.zeros((row.max() - first + 1, right - left), counts.dtype)
+    np.add.at(diff, (row - first, start - left), 1)
+    end = stop < right
+    np.add.at(diff, (row[end] - first, stop[end] - left), -1)
+    counts[first:first + diff.shape[0], left:right] += np.cumsum(diff, axis=1, out=diff)
+    return counts
+
+
+def coverage_map(geometry, imagewcs, shape, instruments=None, dtype=np.int16):
+    '''Number of exposures covering each pixel of an image (shape (ny, nx),
+    WCS imagewcs) for the footprints of compute_footprints(): every aperture
+    of every dither and mosaic position counts once.
+    instruments restricts the count to some of 'msa', 'long' and 'short'.'''
+    names = [name for name in geometry if instruments is None or name in instruments]
+    counts = np.zeros(shape, dtype)
+    if not names:
+        return counts
+    # all the apertures in one fill
+    ra = np.concatenate([geometry[name]['ra'].ravel() for name in names])
+    dec = np.concatenate([geometry[name]['dec'].ravel() for name in names])
+    x, y = world_to_pixel(imagewcs, ra, dec)
+    return fill_polygons(x.reshape(-1, 5), y.reshape(-1, 5), counts)
+
+
+def coverage_image(inputfile, geometry, outfile=None, instruments=None, ext=None):
+    '''coverage_map() on the pixel grid of the image inputfile (HDU ext, by
+    default the first one with a celestial WCS, see images.image_hdu()),
+    written as a FITS image with the celestial WCS of the image to outfile
+    if given. Returns the map.'''
+    header = image_header(inputfile, ext)
+    imagewcs = image_wcs(inputfile, ext)
+    counts = coverage_map(geometry, imagewcs, (header['NAXIS2'], header['NAXIS1']),
+                          instruments)
+    if outfile is not None:
+        hdu = fits.PrimaryHDU(counts, imagewcs.celestial.to_header(relax=True))
+        hdu.header['BUNIT'] = 'exposures'
+        hdu.writeto(outfile, overwrite=True)
+    return counts
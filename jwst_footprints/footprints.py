@@ -39,21 +39,18 @@ from __future__ import absolute_import, division, print_function
 
 import sys
 import os
+import re
 import numpy as np
+from functools import lru_cache
 
 from math import *
-from astropy import wcs
-from astropy.io import fits
-from astropy.io import ascii
 from astropy import units as u
 from astropy.coordinates import SkyCoord
-import pyds9
 from . import PKG_DATA_DIR
+from . import catalogs
+from . import images
+from . import regions
 
-#readfitsimage = True
-#self.readfitsimageVar = StringVar()
-#self.readfitsimageVar.set(self.config['readfitsimage'])
-#print(readfitsimageVar)
 
 def arcsec2deg(ra, dec, v2arcsec, v3arcsec, xr, yr):
     v2deg = ra + (v2arcsec - xr) / (3600. * cos(radians(dec)))
@@ -63,94 +60,191 @@ def arcsec2deg(ra, dec, v2arcsec, v3arcsec, xr, yr):
 
 def unit(ra, dec):
     ''' Converts vector expressed in Euler angles to unit vector components.
-    ra and dec in degrees
+    ra and dec in degrees, scalars or arrays of the same shape
+    (the components are stacked along the first axis).
     Can be used for V2V3 after converting from arcsec to degrees)'''
 
-    rar = radians(ra)
-    decr = radians(dec)
-    u = np.array([cos(rar) * cos(decr), sin(rar) * cos(decr), sin(decr)])
+    rar = np.radians(ra)
+    decr = np.radians(dec)
+    u = np.array([np.cos(rar) * np.cos(decr), np.sin(rar) * np.cos(decr), np.sin(decr)])
     return u
 
 
 def radec(u):
     '''convert unit vector to Euler angles
-    u is an array or list of length 3'''
+    u is an array or list of length 3, each component may itself be an array'''
 
     if len(u) != 3:
         print('Not a vector')
         return
-    norm = sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
-    dec = degrees(asin(u[2] / norm))
-    ra = degrees(atan2(u[1], u[0]))  # atan2 puts it in the correct quadrant
-    if ra < 0.0:
-        ra += 360.0    # Astronomers prefer the range 0 to 360 degrees
+    norm = np.sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
+    dec = np.degrees(np.arcsin(u[2] / norm))
+    ra = np.degrees(np.arctan2(u[1], u[0]))  # atan2 puts it in the correct quadrant
+    ra = np.where(ra < 0.0, ra + 360.0, ra)    # Astronomers prefer the range 0 to 360 degrees
+    if np.ndim(ra) == 0:
+        return (float(ra), float(dec))
     return (ra, dec)
 
 
+def tangent_plane(ra, dec, ra0, dec0):
+    '''Gnomonic projection of ra, dec (degrees) on the plane tangent to the
+    sky at ra0, dec0: standard coordinates xi (east) and eta (north) in
+    arcsec. Great circles, like the aperture edges, project to straight lines.'''
+    rar = np.radians(np.asarray(ra, np.float64) - ra0)
+    decr = np.radians(dec)
+    dec0r = np.radians(dec0)
+    cosc = np.sin(dec0r) * np.sin(decr) + np.cos(dec0r) * np.cos(decr) * np.cos(rar)
+    xi = np.cos(decr) * np.sin(rar) / cosc
+    eta = (np.cos(dec0r) * np.sin(decr) - np.sin(dec0r) * np.cos(decr) * np.cos(rar)) / cosc
+    return (np.degrees(xi) * 3600.0, np.degrees(eta) * 3600.0)
+
+
+def tangent_plane_inverse(xi, eta, ra0, dec0):
+    '''ra, dec (degrees) of the standard coordinates xi, eta (arcsec) on the
+    plane tangent to the sky at ra0, dec0, the inverse of tangent_plane()'''
+    x = np.radians(np.asarray(xi, np.float64) / 3600.0)
+    y = np.radians(np.asarray(eta, np.float64) / 3600.0)
+    dec0r = np.radians(dec0)
+    ra = ra0 + np.degrees(np.arctan2(x, np.cos(dec0r) - y * np.sin(dec0r)))
+    dec = np.degrees(np.arctan2(np.sin(dec0r) + y * np.cos(dec0r),
+                                np.hypot(x, np.cos(dec0r) - y * np.sin(dec0r))))
+    return (np.mod(ra, 360.0), dec)
+
+
 def v2v3(u):
-    '''Convert unit vector to v2v3'''
+    '''Convert unit vector to v2v3
+    u is an array or list of length 3, each component may itself be an array'''
     if len(u) != 3:
         print('Not a vector')
         return
-    norm = sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
+    norm = np.sqrt(u[0]**2 + u[1]**2 + u[2]**2)  # Works for list or array
     # atan2 puts it in the correct quadrant
-    v2 = 3600 * degrees(atan2(u[1], u[0]))
-    v3 = 3600 * degrees(asin(u[2] / norm))
+    v2 = 3600 * np.degrees(np.arctan2(u[1], u[0]))
+    v3 = 3600 * np.degrees(np.arcsin(u[2] / norm))
+    if np.ndim(v2) == 0:
+        return (float(v2), float(v3))
     return (v2, v3)
 
 
 def rotate(axis, angle):
     '''Fundamental rotation matrices.
-    Rotate by angle measured in degrees, about axis 1 2 or 3'''
+    Rotate by angle measured in degrees, about axis 1 2 or 3
+    An array of angles gives a stack of matrices with shape angle.shape + (3, 3)'''
     if axis not in list(range(1, 4)):
         print('Axis must be in range 1 to 3')
         return
-    r = np.zeros((3, 3))
+    theta = np.radians(angle)
+    r = np.zeros(np.shape(theta) + (3, 3))
     ax0 = axis - 1  # Allow for zero offset numbering
-    theta = radians(angle)
-    r[ax0, ax0] = 1.0
+    r[..., ax0, ax0] = 1.0
     ax1 = (ax0 + 1) % 3
     ax2 = (ax0 + 2) % 3
-    r[ax1, ax1] = cos(theta)
-    r[ax2, ax2] = cos(theta)
-    r[ax1, ax2] = -sin(theta)
-    r[ax2, ax1] = sin(theta)
+    r[..., ax1, ax1] = np.cos(theta)
+    r[..., ax2, ax2] = np.cos(theta)
+    r[..., ax1, ax2] = -np.sin(theta)
+    r[..., ax2, ax1] = np.sin(theta)
     return r
 
 
-def attitude(v2, v3, ra, dec, pa):
-    '''This will make a rotation matrix which rotates a unit vector representing a v2,v3 position
-    to a unit vector representing an RA, Dec pointing with an assigned position angle
-    Described in JWST-STScI-001550, SM-12, section 6.1'''
+# sky rotations kept by sky_rotation()
+ATTITUDE_CACHE_SIZE = 1024
 
-    # v2, v3 in arcsec, ra, dec and position angle in degrees
-    v2d = v2 / 3600.0
-    v3d = v3 / 3600.0
 
-    # Get separate rotation matrices
-    mv2 = rotate(3, -v2d)
-    mv3 = rotate(2, v3d)
+def _sky_rotation(ra, dec, pa):
+    # Combine as mra*mdec*mpa
     mra = rotate(3, ra)
-    mdec = rotate(2, -dec)
-    mpa = rotate(1, -pa)
+    mdec = rotate(2, -np.asarray(dec, np.float64))
+    mpa = rotate(1, -np.asarray(pa, np.float64))
+    return np.matmul(mra, np.matmul(mdec, mpa))
 
-    # Combine as mra*mdec*mpa*mv3*mv2
-    m = np.dot(mv3, mv2)
-    m = np.dot(mpa, m)
-    m = np.dot(mdec, m)
-    m = np.dot(mra, m)
 
+@lru_cache(maxsize=ATTITUDE_CACHE_SIZE)
+def _sky_rotation_cached(ra, dec, pa):
+    m = _sky_rotation(ra, dec, pa)
+    m.flags.writeable = False
     return m
 
 
+def sky_rotation(ra, dec, pa):
+    '''Sky part mra*mdec*mpa of the attitude matrix, ra, dec and position angle
+    in degrees. The matrix of a single (ra, dec, pa) is memoized (the last
+    ATTITUDE_CACHE_SIZE are kept, read-only), so that the instruments, dither
+    positions and centres sharing a pointing build it once; arrays give a
+    stack of matrices.'''
+    ra = np.asarray(ra, np.float64)
+    dec = np.asarray(dec, np.float64)
+    pa = np.asarray(pa, np.float64)
+    if ra.size == 1 and dec.size == 1 and pa.size == 1:
+        shape = np.broadcast(ra, dec, pa).shape
+        m = _sky_rotation_cached(float(ra.ravel()[0]), float(dec.ravel()[0]), float(pa.ravel()[0]))
+        return m.reshape(shape + (3, 3))
+    return _sky_rotation(ra, dec, pa)
+
+
+def v2v3_rotation(v2, v3):
+    '''Instrument part mv3*mv2 of the attitude matrix, which brings the V2/V3
+    reference point v2, v3 (arcsec) to the x axis'''
+    v2d = np.asarray(v2, np.float64) / 3600.0
+    v3d = np.asarray(v3, np.float64) / 3600.0
+    mv2 = rotate(3, -v2d)
+    mv3 = rotate(2, v3d)
+    return np.matmul(mv3, mv2)
+
+
+def attitude(v2, v3, ra, dec, pa):
+    '''This will make a rotation matrix which rotates a unit vector representing a v2,v3 position
+    to a unit vector representing an RA, Dec pointing with an assigned position angle
+    Described in JWST-STScI-001550, SM-12, section 6.1
+    The arguments broadcast against each other: arrays give a stack of matrices
+
+    The matrix is the product mra*mdec*mpa*mv3*mv2 of the memoized sky part
+    (sky_rotation()) and the V2/V3 part (v2v3_rotation()), so that only the
+    latter is recomputed for every dither position of a pointing.'''
+
+    # v2, v3 in arcsec, ra, dec and position angle in degrees
+    return np.matmul(sky_rotation(ra, dec, pa), v2v3_rotation(v2, v3))
+
+
 def pointing(attitude, v2, v3):
-    '''Using the attitude matrix to calculate where any v2v3 position points on the sky'''
-    v2d = v2 / 3600.0
-    v3d = v3 / 3600.0
-    v = unit(v2d, v3d)
-    w = np.dot(attitude, v)
-    rd = radec(w)
-    return rd  # tuple containing ra and dec
+    '''Using the attitude matrix to calculate where any v2v3 position points on the sky
+
+    v2, v3 are scalars or arrays of vertices in arcsec. attitude is a single 3x3
+    matrix or a stack of them with shape (..., 3, 3), in which case every vertex is
+    projected through every attitude in one matrix product and ra, dec come back
+    with shape (..., nvertex). A stack of vertex arrays (..., nvertex) is paired
+    with the matching attitude of the stack.'''
+    v2d = np.asarray(v2, np.float64) / 3600.0
+    v3d = np.asarray(v3, np.float64) / 3600.0
+    if np.ndim(attitude) == 2 and v2d.ndim == 0 and v3d.ndim == 0:
+        v = unit(v2d, v3d)
+        w = np.dot(attitude, v)
+        rd = radec(w)
+        return rd  # tuple containing ra and dec
+
+    v = unit(np.atleast_1d(v2d), np.atleast_1d(v3d))
+    # (3, ..., nvertex) -> (..., 3, nvertex) so that matmul broadcasts the stacks
+    w = np.matmul(attitude, np.moveaxis(v, 0, -2))
+    rd = radec(np.moveaxis(w, -2, 0))
+    return rd  # tuple containing the ra and dec arrays
+
+
+def inverse_pointing(attitude, ra, dec):
+    '''The inverse of pointing(): V2, V3 (arcsec) of sky positions ra, dec
+    (degrees) for an attitude matrix
+
+    ra, dec are scalars or arrays of n positions. attitude is a single 3x3
+    matrix or a stack with shape (..., 3, 3), e.g. one per position angle;
+    every position goes through every attitude in one matrix product and v2,
+    v3 come back with shape (..., n). In the V2/V3 frame the aperture tables
+    are fixed, so the sources of a catalog can be matched against the
+    apertures for many attitudes without any pixel transform.'''
+    if np.ndim(attitude) == 2 and np.ndim(ra) == 0 and np.ndim(dec) == 0:
+        return v2v3(np.dot(np.transpose(attitude), unit(ra, dec)))
+
+    u = unit(np.atleast_1d(ra), np.atleast_1d(dec))
+    # the inverse of a rotation is its transpose
+    w = np.matmul(np.swapaxes(attitude, -1, -2), u)
+    return v2v3(np.moveaxis(w, -2, 0))
 
 
 def linear_transformation(theta, xshift, yshift,
@@ -253,7 +347,51 @@ def rotate_short(x2, x3, theta):
 #------------------------------
 
 
-def create_footprint(inputfile, ra, dec, napertures, footprintname, color):
+def world_to_pixel(imagewcs, ra, dec, tolerance=images.WORLD2PIX_TOLERANCE):
+    '''Image pixel coordinates (1-based, as in DS9) of ra, dec in degrees
+
+    ra and dec are arrays of any (matching) shape, transformed in a single
+    call; x and y come back as float64 arrays of that shape.
+    The distortions of the WCS (SIP, lookup tables) are taken into account,
+    to tolerance pixels, by interpolation on the inverse grid of the WCS
+    (see images.inverse_grid()), made the first time it is needed.'''
+    ra = np.asarray(ra, np.float64)
+    dec = np.asarray(dec, np.float64)
+    if imagewcs.has_distortion:
+        grid = images.inverse_grid(imagewcs, tolerance)
+        if grid is not None:
+            return grid.world2pix(imagewcs, ra, dec)
+        x, y = imagewcs.all_world2pix(ra, dec, 1, tolerance=tolerance, quiet=True)
+    else:
+        x, y = imagewcs.wcs_world2pix(ra, dec, 1)
+    return (np.asarray(x, np.float64), np.asarray(y, np.float64))
+
+
+# DS9 sky systems the regions can be written in, in degrees, instead of pixels
+SKY_COORDSYS = ('fk5', 'icrs')
+
+
+def region_coordsys(imagewcs):
+    '''DS9 coordinate system of the regions drawn with imagewcs: 'image' for
+    a WCS, or imagewcs itself when it names a sky system of SKY_COORDSYS'''
+    if not isinstance(imagewcs, str):
+        return 'image'
+    if imagewcs not in SKY_COORDSYS:
+        raise ValueError('unknown coordinate system {}'.format(imagewcs))
+    return imagewcs
+
+
+def region_coordinates(imagewcs, ra, dec):
+    '''Region coordinates of ra, dec in degrees: image pixels of the WCS
+    imagewcs (world_to_pixel()), or ra, dec untransformed when imagewcs is
+    a sky system (see region_coordsys()), which needs no image'''
+    if region_coordsys(imagewcs) == 'image':
+        return world_to_pixel(imagewcs, ra, dec)
+    return (np.asarray(ra, np.float64), np.asarray(dec, np.float64))
+
+
+def create_footprint(inputfile, ra, dec, napertures, footprintname, color,
+                     imagewcs=None):
     global w
     # input
 
@@ -262,54 +400,23 @@ def create_footprint(inputfile, ra, dec, napertures, footprintname, color):
     # footprintname is the name of the output file
     # napertures = number of apertures in footprint ( Nircam LONG = 2, NIRCam
     # short = 8, MSA = 4)
+    # imagewcs = WCS of the image, defaults to the one of the last footprints() call,
+    # or 'fk5' / 'icrs' for regions in degrees
 
+    if imagewcs is None:
+        imagewcs = w
     nrows = napertures * 5
-    #print(nrows)
-    ra = np.array(ra, np.float_)  # np.array(ra, np.float_)
-    dec = np.array(dec, np.float_)  # np.array(dec, np.float_)
-    world = []
-    # print ra
-    #sys.exit("quitting now...")
-
-    for i in range(0, nrows):
-        #world = np.append(world,(ra[i],dec[i]))
-        world.append((ra[i], dec[i]))
-    pixcrd2 = w.wcs_world2pix(world, 1)
-    #print(pixcrd2)
-    xx = []
-    yy = []
-    for i in range(0, nrows):
-        xx.append(pixcrd2[[i], 0])
-        yy.append(pixcrd2[[i], 1])
-        #xx = np.append(xx,pixcrd2[[i],0])
-        #yy = np.append(yy,pixcrd2[[i],1])
-
-    xwcs = np.array(xx, np.float_)
-    ywcs = np.array(yy, np.float_)
-    x = [float(i) for i in xwcs]
-    y = [float(i) for i in ywcs]
-    # print x
-    # polygon x1 y1 x2 y2 x3 y3 ...
+    x, y = region_coordinates(imagewcs, np.ravel(ra)[:nrows], np.ravel(dec)[:nrows])
 
-    outputfile = footprintname
-    file = open(outputfile, "w")
-    file.write(
-        'global color=' +
-        color +
-        ' width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-    file.write('image\n')
-    pos = 0
-    for i in range(0, napertures):
-        newline = 'polygon ' + str(x[pos]) + '  ' + str(y[pos]) + '  ' + str(x[pos + 1]) + '  ' + str(y[pos + 1]) + '  ' + str(x[pos + 2]) + '  ' + str(
-            y[pos + 2]) + '  ' + str(x[pos + 3]) + '  ' + str(y[pos + 3]) + '  ' + str(x[pos + 4]) + '  ' + str(y[pos + 4]) + '  ' + '# text={}' + '\n'
-        file.write(newline)
-        pos = pos + 5
-    file.close()
+    # polygon x1 y1 x2 y2 x3 y3 ...
+    regions.write_polygons(footprintname, x.reshape(napertures, 5),
+                           y.reshape(napertures, 5), color, region_coordsys(imagewcs))
 #------------------------------
 
 
 #------------------------------
-def create_footprint_center(inputfile, ra, dec, footprintname, color):
+def create_footprint_center(inputfile, ra, dec, footprintname, color,
+                            imagewcs=None):
     global w
 
     '''
@@ -319,28 +426,10 @@ def create_footprint_center(inputfile, ra, dec, footprintname, color):
     # napertures = number of apertures in footprint ( Nircam LONG = 2, NIRCam
     # short = 8, MSA = 4)
     '''
-    ra = np.array(ra, np.float_)
-    dec = np.array(dec, np.float_)
-    world = []
-    world.append((ra, dec))
-    pixcrd2 = w.wcs_world2pix(world, 1)
-    xx = float(pixcrd2[[0], 0])
-    yy = float(pixcrd2[[0], 1])
-    c2 = "%10s" % str(xx)
-    c3 = "%10s" % str(yy)
-
-    # polygon x1 y1 x2 y2 x3 y3 ...
-
-    outputfile = footprintname
-    file = open(outputfile, "w")
-    file.write(
-        'global color=' +
-        color +
-        ' width=1 font="helvetica 15 normal roman"  select=0 highlite=1 \n')
-    file.write('image\n')
-    newline = 'point(' + c2 + ',' + c3 + ') # point=cross 20  \n'
-    file.write(newline)
-    file.close()
+    if imagewcs is None:
+        imagewcs = w
+    x, y = region_coordinates(imagewcs, ra, dec)
+    regions.write_points(footprintname, x, y, color, region_coordsys(imagewcs))
 
 #------------------------------
 def read_table(inputfile, delim=' '):
@@ -353,6 +442,594 @@ def read_table(inputfile, delim=' '):
     return list(zip(*records))
 
 
+def centre_mosaic_short(x2, x3):
+    # centre of the NIRCam short wavelength module pair used when tiling a mosaic
+    xa = (x2[0] + x2[22]) / 2.0
+    ya = (x3[0] + x3[22]) / 2.0
+    xb = (x2[8] + x2[26]) / 2.0
+    yb = (x3[8] + x3[26]) / 2.0
+    xr = ((xa + xb) / 2.)
+    yr = ((ya + yb) / 2.)
+    return (xr, yr)
+
+
+#------------------------------
+#   aperture templates: each data table is parsed once per session and
+#   shared (read-only) by every call to footprints()
+
+# instrument : (data table, rotation centre, mosaic rotation centre,
+#               offset from the aperture PA to the V3 position angle)
+APERTURE_TABLES = {
+    'msa': ('table-nirspec-msa.txt', rotate_msa, None, -137.4874),    #  12MAR2018   NRS_FULL_MSA_V3IdlYang = 137.4874
+    'ifu': ('table-nirspec-ifu.txt', rotate_ifu, None, -137.4874),
+    'long': ('table-nircam-long.txt', rotate_long, None, 0.0265),     #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
+    'short': ('table-nircam-short.txt', rotate_short, centre_mosaic_short, 0.0265),
+}
+
+_apertures = {}
+
+
+class ApertureTemplate(object):
+    '''V2/V3 vertices (arcsec) of the apertures of one instrument
+
+    table is a structured array with one row per vertex (v2, v3, aperture, v2ref,
+    v3ref); every aperture is a closed polygon of 5 vertices. xr, yr is the centre
+    the footprint is rotated about and xr_mosaic, yr_mosaic the one used when
+    the footprint is tiled into a mosaic. pa_offset is added to the aperture
+    position angle to get the position angle of the attitude.'''
+
+    dtype = np.dtype([('v2', np.float64),
+                      ('v3', np.float64),
+                      ('aperture', 'U20'),
+                      ('v2ref', np.float64),
+                      ('v3ref', np.float64)])
+
+    def __init__(self, name, filename, centre, centre_mosaic=None, pa_offset=0.0):
+        self.name = name
+        self.pa_offset = pa_offset
+        v2, v3, aper, v2ref, v3ref = read_table(filename)
+        self.table = np.empty(len(v2), self.dtype)
+        self.table['v2'] = v2
+        self.table['v3'] = v3
+        self.table['aperture'] = aper
+        self.table['v2ref'] = v2ref
+        self.table['v3ref'] = v3ref
+        self.table.flags.writeable = False
+
+        self.v2 = np.ascontiguousarray(self.table['v2'])
+        self.v3 = np.ascontiguousarray(self.table['v3'])
+        self.v2.flags.writeable = False
+        self.v3.flags.writeable = False
+        self.napertures = len(self.table) // 5
+        self.names = self.table['aperture'][::5]
+
+        self.xr, self.yr = centre(self.v2, self.v3, 0.0)[2:]
+        if centre_mosaic is None:
+            self.xr_mosaic, self.yr_mosaic = self.xr, self.yr
+        else:
+            self.xr_mosaic, self.yr_mosaic = centre_mosaic(self.v2, self.v3)
+
+    def __repr__(self):
+        return '<ApertureTemplate %s: %d apertures>' % (self.name, self.napertures)
+
+
+def get_aperture(instrument):
+    '''Aperture template of an instrument ('msa', 'ifu', 'long' or 'short').
+    The data table is read on first use only.'''
+    if instrument not in _apertures:
+        filename, centre, centre_mosaic, pa_offset = APERTURE_TABLES[instrument]
+        _apertures[instrument] = ApertureTemplate(
+            instrument, os.path.join(PKG_DATA_DIR, filename), centre, centre_mosaic, pa_offset)
+    return _apertures[instrument]
+
+
+def load_apertures():
+    '''Read every aperture template, so that later calls do no file I/O'''
+    return dict((name, get_aperture(name)) for name in APERTURE_TABLES)
+
+
+def msa_quadrants():
+    '''Indices of the four MSA quadrants (NRS_FULL_MSA1-4) among the apertures
+    of the msa template'''
+    return np.nonzero(np.char.startswith(get_aperture('msa').names, 'NRS_FULL_MSA'))[0]
+
+
+#------------------------------
+#   NIRCam dither patterns: offsets (arcsec) of the reference point at each
+#   dither position, applied as  v2ref = xr - v2,  v3ref = yr + v3
+#   suffix  : names the region file, ds9-long-<suffix>.reg
+#   mosaic  : the pattern can be repeated at the user mosaic offset
+#   centre  : if given, both channels rotate about the centre of the long
+#             wavelength channel shifted by (v2, v3) arcsec
+
+DITHER_PATTERNS = {
+    'None': dict(v2=[0.0],
+                 v3=[0.0],
+                 suffix='no', mosaic=True),
+    'FULL3': dict(v2=[0.0, -58.0, 58.0],
+                  v3=[0.0, -23.5, 23.5],
+                  suffix='three', mosaic=True),
+    'FULL3TIGHT': dict(v2=[0.0, -58.0, 58.0],
+                       v3=[0.0, -7.5, 7.5],
+                       suffix='threetight', mosaic=True),
+    'FULL6': dict(v2=[-72.0, -43.0, -14.0, 15.0, 44.0, 73.0],
+                  v3=[-30.0, -18.0, -6.0, 6.0, 18.0, 30.0],
+                  suffix='six', mosaic=False, centre=(0.5, 0.0)),
+    #   8NIRSPEC  29NOV2017
+    '8NIRSPEC': dict(v2=[-24.6, -24.4, 24.6, 24.4, 24.6, 24.4, -24.6, -24.4],
+                     v3=[-64.1, -89.0, -88.8, -63.9, 64.1, 89.0, 88.8, 63.9],
+                     suffix='8nirspec', mosaic=False),
+}
+
+
+def register_dither_pattern(name, v2, v3, suffix=None, mosaic=True, centre=None):
+    '''Add a user dither pattern, offsets in arcsec (see DITHER_PATTERNS)'''
+    if len(v2) != len(v3):
+        raise ValueError('dither pattern {}: v2 and v3 offsets differ in length'.format(name))
+    pattern = dict(v2=list(v2), v3=list(v3),
+                   suffix=suffix or name.lower(), mosaic=mosaic)
+    if centre is not None:
+        pattern['centre'] = tuple(centre)
+    DITHER_PATTERNS[name] = pattern
+    return pattern
+
+
+# other names of the patterns: 'No' was the default of footprints()
+DITHER_ALIASES = {'No': 'None'}
+
+
+def dither_pattern(name):
+    '''Definition of the dither pattern name (see DITHER_PATTERNS)'''
+    name = DITHER_ALIASES.get(name, name)
+    if name not in DITHER_PATTERNS:
+        raise ValueError('unknown dither pattern {}, known patterns: {}'.format(
+            name, ', '.join(sorted(DITHER_PATTERNS))))
+    return DITHER_PATTERNS[name]
+
+
+def dither_reference(instrument, pattern='None', mosaic='No',
+                     usershiftv2=0.0, usershiftv3=0.0):
+    '''Position (v2, v3 arcsec) of the reference point at every dither position
+    of pattern; with mosaic == 'Yes' the pattern is repeated at the user offset.
+    Returns two arrays of length n_dither.'''
+    template = get_aperture(instrument)
+    dither = dither_pattern(pattern)
+    shiftv2 = np.array(dither['v2'], np.float64)
+    shiftv3 = np.array(dither['v3'], np.float64)
+
+    if 'centre' in dither:
+        lwc = get_aperture('long')
+        xr = lwc.xr + dither['centre'][0]
+        yr = lwc.yr + dither['centre'][1]
+    else:
+        xr = template.xr
+        yr = template.yr
+
+    if mosaic == 'Yes':
+        if not dither['mosaic']:
+            raise ValueError('Mosaic pattern is disabled for {} dither pattern'.format(pattern))
+        usershiftv2 = float(usershiftv2)
+        usershiftv3 = float(usershiftv3)
+        # second tile shifted by the user offset, rotate about the middle of the two
+        shiftv2 = np.concatenate([shiftv2, shiftv2 + usershiftv2])
+        shiftv3 = np.concatenate([shiftv3, shiftv3 - usershiftv3])
+        xr = template.xr_mosaic + usershiftv2 / 2.0
+        yr = template.yr_mosaic + usershiftv3 / 2.0
+
+    v20 = xr - shiftv2  # here we shift
+    v30 = yr + shiftv3  # here we shift
+    return (v20, v30)
+
+
+def footprint_pointing(instrument, ra, dec, theta, pattern='None', mosaic='No',
+                       usershiftv2=0.0, usershiftv3=0.0):
+    '''RA, Dec (degrees) of the aperture vertices of an instrument footprint
+    pointed at ra, dec with aperture position angle theta, at every position of
+    a dither pattern. All positions are computed in one pass: the result is a
+    pair of arrays of shape (n_dither, n_vertex), or (n_pa, n_dither, n_vertex)
+    when theta is an array of n_pa position angles. More generally ra, dec and
+    theta may be arrays that broadcast together to a shape S, giving arrays of
+    shape S + (n_dither, n_vertex).'''
+    template = get_aperture(instrument)
+    v20, v30 = dither_reference(instrument, pattern, mosaic,
+                                usershiftv2, usershiftv3)
+    pa = np.asarray(theta, np.float64) + template.pa_offset
+    # one attitude per (pointing, position angle, dither position)
+    m = attitude(v20, v30, np.asarray(ra, np.float64)[..., np.newaxis],
+                 np.asarray(dec, np.float64)[..., np.newaxis], pa[..., np.newaxis])
+    return pointing(m, template.v2, template.v3)
+
+
+def pa_sweep(instrument, ra, dec, theta, pattern='None', mosaic='No',
+             usershiftv2=0.0, usershiftv3=0.0, imagewcs=None):
+    '''Footprint of an instrument ('msa', 'long' or 'short') for every aperture
+    position angle in theta (degrees), e.g. np.arange(0., 360., 0.1)
+
+    ra, dec : pointing, degrees or hh mm ss.sss  dd mm ss.sss strings
+    imagewcs : optional astropy WCS, to get image pixel coordinates as well
+
+    Returns the sky coordinates as an (n_pa, n_vertex, 2) array of RA, Dec,
+    with every dither position of the pattern appended along the vertex axis
+    (5 vertices per aperture). With imagewcs, returns (sky, pixel) where pixel
+    is the matching (n_pa, n_vertex, 2) array of x, y (1-based, like the
+    region files).'''
+    ra, dec = parse_coordinates(ra, dec)
+    theta = np.atleast_1d(np.asarray(theta, np.float64))
+    myv2, myv3 = footprint_pointing(instrument, ra, dec, theta, pattern, mosaic,
+                                    usershiftv2, usershiftv3)
+    npa = len(theta)
+    sky = np.stack([myv2.reshape(npa, -1), myv3.reshape(npa, -1)], axis=-1)
+    if imagewcs is None:
+        return sky
+    x, y = world_to_pixel(imagewcs, sky[..., 0], sky[..., 1])
+    return (sky, np.stack([x, y], axis=-1))
+
+
+# footprints in ideal coordinates kept by ideal_footprint()
+TEMPLATE_CACHE_SIZE = 256
+
+
+def _dither_key(pattern):
+    # the definition of the pattern in the cache key, so that a pattern
+    # registered again or edited in DITHER_PATTERNS is not taken from the cache
+    dither = dither_pattern(pattern)
+    return (tuple(dither['v2']), tuple(dither['v3']), dither.get('centre'), dither['mosaic'])
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _ideal_footprint(instrument, pattern, dither, mosaic, usershiftv2, usershiftv3, theta):
+    if theta == 0.0:
+        ra, dec = footprint_pointing(instrument, 0.0, 0.0, 0.0, pattern, mosaic,
+                                     usershiftv2, usershiftv3)
+        xi, eta = tangent_plane(ra, dec, 0.0, 0.0)
+    else:
+        xi0, eta0 = _ideal_footprint(instrument, pattern, dither, mosaic,
+                                     usershiftv2, usershiftv3, 0.0)
+        t = np.radians(theta)
+        xi = xi0 * np.cos(t) + eta0 * np.sin(t)
+        eta = eta0 * np.cos(t) - xi0 * np.sin(t)
+    xi.flags.writeable = False
+    eta.flags.writeable = False
+    return (xi, eta)
+
+
+def ideal_footprint(instrument, pattern='None', mosaic='No',
+                    usershiftv2=0.0, usershiftv3=0.0, theta=0.0):
+    '''Ideal coordinates (tangent_plane() standard coordinates about the
+    pointing, arcsec) of the aperture vertices of an instrument footprint at
+    aperture position angle theta, two read-only (n_dither, n_vertex) arrays.
+    The footprint at theta = 0 is computed once with footprint_pointing(), any
+    other position angle is a rotation of it; the last TEMPLATE_CACHE_SIZE
+    (instrument, pattern and its offsets, mosaic, user offsets, position
+    angle) are kept.'''
+    return _ideal_footprint(instrument, str(pattern), _dither_key(pattern), str(mosaic),
+                            float(usershiftv2), float(usershiftv3), float(theta))
+
+
+def footprint_pointing_tangent(instrument, ra, dec, theta, pattern='None', mosaic='No',
+                               usershiftv2=0.0, usershiftv3=0.0):
+    '''footprint_pointing() for a pointing ra, dec (degrees, numbers) as a
+    rotation of the cached ideal footprint (ideal_footprint()) and a gnomonic
+    deprojection at ra, dec; theta is a number or an array of position angles.
+
+    The position angle turns the footprint about the pointing axis, which is
+    a plain rotation of the plane tangent at the pointing, so this is not an
+    approximation: the vertices agree with footprint_pointing() to rounding
+    error, below 1e-7 arcsec at any RA/Dec including next to the poles.'''
+    if np.ndim(theta) == 0:
+        xi, eta = ideal_footprint(instrument, pattern, mosaic, usershiftv2, usershiftv3,
+                                  float(theta))
+    else:
+        xi0, eta0 = ideal_footprint(instrument, pattern, mosaic, usershiftv2, usershiftv3, 0.0)
+        t = np.radians(np.asarray(theta, np.float64))[..., np.newaxis, np.newaxis]
+        xi = xi0 * np.cos(t) + eta0 * np.sin(t)
+        eta = eta0 * np.cos(t) - xi0 * np.sin(t)
+    return tangent_plane_inverse(xi, eta, ra, dec)
+
+
+def parse_coordinates(ra, dec):
+    '''RA, Dec in degrees from either degrees or hh mm ss.sss  dd mm ss.sss strings'''
+    if isinstance(ra, str) and (' ' in ra) and (' ' in dec):
+        # it recognizes that the string has the format   hh mm ss.sss
+        c = SkyCoord(ra + ' ' + dec, unit=(u.hourangle, u.deg))
+        return (c.ra.deg, c.dec.deg)
+    #   string is in units of degrees
+    return (float(ra), float(dec))
+
+
+# source types of the 3 column catalogs: region file name and colour
+SOURCE_CLASSES = {'F': ('fillers', 'yellow'),
+                  'P': ('primary', 'red')}
+# colours of the other source types
+SOURCE_COLORS = ['cyan', 'magenta', 'orange', 'white', 'green', 'blue']
+# radius of the source circles, in image pixels and on the sky
+SOURCE_RADIUS = 5
+SOURCE_RADIUS_SKY = '0.5"'
+
+
+def footprint_cap(geometry, margin=1.0):
+    '''Spherical cap holding every footprint vertex of compute_footprints()
+    (all instruments, dithers and mosaic positions), widened by margin arcmin.
+    Returns (ra, dec, radius) in degrees, None if there are no footprints'''
+    if not geometry:
+        return None
+    u = np.concatenate([unit(fp['ra'].ravel(), fp['dec'].ravel())
+                        for fp in geometry.values()], axis=1)
+    # centre on the mean direction of the vertices, radius to the farthest one
+    centre = u.mean(axis=1)
+    centre = centre / np.sqrt(np.dot(centre, centre))
+    radius = np.degrees(np.arccos(np.clip(np.dot(centre, u).min(), -1.0, 1.0)))
+    ra, dec = radec(centre)
+    return (ra, dec, radius + margin / 60.0)
+
+
+def footprint_box(geometry, imagewcs, shape, margin=20):
+    '''Pixel bounding box of every footprint vertex of compute_footprints()
+    (all instruments, dithers and mosaic positions) on an image of shape
+    (ny, nx), widened by margin pixels and cut to the image.
+    Returns (xmin, xmax, ymin, ymax), 0-based with the ends excluded (slices
+    of the image array), or None if no footprint falls on the image'''
+    if not geometry:
+        return None
+    ra = np.concatenate([fp['ra'].ravel() for fp in geometry.values()])
+    dec = np.concatenate([fp['dec'].ravel() for fp in geometry.values()])
+    x, y = world_to_pixel(imagewcs, ra, dec)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return None
+    x, y = x[finite] - 1.0, y[finite] - 1.0
+    ny, nx = shape
+    xmin = int(np.clip(np.floor(x.min()) - margin, 0, nx))
+    xmax = int(np.clip(np.ceil(x.max()) + margin + 1, 0, nx))
+    ymin = int(np.clip(np.floor(y.min()) - margin, 0, ny))
+    ymax = int(np.clip(np.ceil(y.max()) + margin + 1, 0, ny))
+    if xmax <= xmin or ymax <= ymin:
+        return None
+    return (xmin, xmax, ymin, ymax)
+
+
+def in_cap(ra, dec, cap):
+    '''True for the positions (degrees, arrays) inside cap = (ra, dec, radius)'''
+    centre = unit(cap[0], cap[1])
+    return np.dot(centre, unit(ra, dec)) >= np.cos(np.radians(cap[2]))
+
+
+def create_source_regions(sourcelist, outdir, imagewcs, chunksize=catalogs.CHUNKSIZE,
+                          cap=None, cache='No', colsources=None):
+    '''Region files of the sources in a 2 (ra dec) or 3 (ra dec type) column
+    catalog, returns the list of files written
+
+    A 3 column catalog gives one file per source type, any number of types:
+    ds9-sources-fillers.reg (F), ds9-sources-primary.reg (P) and
+    ds9-sources-<type>.reg (characters other than letters, digits and _.+-
+    replaced by _, and -2, -3... added to a name already used, e.g. type
+    'primary' next to P). colsources is a dict type -> colour updating the
+    colours of SOURCE_CLASSES; other types take the colours of SOURCE_COLORS
+    in turn.
+
+    The catalog is read, transformed to pixels and written chunksize rows at
+    a time, so catalogs of any size are drawn in a fixed amount of memory.
+    With a cap (ra, dec, radius) from footprint_cap() only the sources inside
+    it are transformed and written. With cache == 'Yes' the catalog is read
+    from its binary copy (see catalogs.load_catalog()).
+    imagewcs may be a sky system, 'fk5' or 'icrs', for regions in degrees
+    that need no image (see region_coordinates()).'''
+    print('creating region file from source list')
+    # here we read the list ra dec and create a DS9 region file
+    ncol = catalogs.catalog_columns(sourcelist)
+    if ncol < 2:
+        print('Invalid input file')
+        return []
+
+    coordsys = region_coordsys(imagewcs)
+    radius = SOURCE_RADIUS if coordsys == 'image' else SOURCE_RADIUS_SKY
+    if ncol == 2:
+        # in this case the user inputs ra dec
+        regionfiles = [outdir+'/ds9-sources.reg']
+        with regions.RegionFile(regionfiles[0], 'yellow', coordsys) as reg:
+            for ra, dec, sourcetype in catalogs.catalog_chunks(sourcelist, chunksize, cache):
+                if cap is not None:
+                    keep = in_cap(ra, dec, cap)
+                    ra, dec = ra[keep], dec[keep]
+                x, y = region_coordinates(imagewcs, ra, dec)
+                reg.circles(x, y, radius)
+        return regionfiles
+
+    # in this case the user inputs ra dec source-type: one region file per type,
+    # the fillers and primary sources files are always written
+    colors = dict((code, SOURCE_CLASSES[code][1]) for code in SOURCE_CLASSES)
+    colors.update(colsources or {})
+    files = {}
+
+    def regionfile(code):
+        if code not in files:
+            if code in SOURCE_CLASSES:
+                name = SOURCE_CLASSES[code][0]
+            else:
+                # only safe characters of the type in the file name
+                name = re.sub(r'[^A-Za-z0-9_.+-]', '_', code)
+            # a type whose name is taken (e.g. 'primary' next to P) gets a number
+            taken = set(reg.filename for reg in files.values())
+            filename = outdir+'/ds9-sources-' + name + '.reg'
+            n = 2
+            while filename in taken:
+                filename = outdir+'/ds9-sources-' + name + '-' + str(n) + '.reg'
+                n += 1
+            nother = len([c for c in files if c not in colors])
+            color = colors.get(code, SOURCE_COLORS[nother % len(SOURCE_COLORS)])
+            files[code] = regions.RegionFile(filename, color, coordsys)
+        return files[code]
+
+    for code in ('F', 'P'):
+        regionfile(code)
+    try:
+        for ra, dec, sourcetype in catalogs.catalog_chunks(sourcelist, chunksize, cache):
+            if cap is not None:
+                keep = in_cap(ra, dec, cap)
+                ra, dec, sourcetype = ra[keep], dec[keep], sourcetype[keep]
+            x, y = region_coordinates(imagewcs, ra, dec)
+            # group the sources by type with one sort, keeping the catalog
+            # order within each type
+            order = np.argsort(sourcetype, kind='stable')
+            sourcetype = sourcetype[order]
+            x, y = x[order], y[order]
+            bounds = np.concatenate([[0], np.flatnonzero(sourcetype[1:] != sourcetype[:-1]) + 1,
+                                     [len(sourcetype)]])
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                if hi > lo:
+                    regionfile(str(sourcetype[lo])).circles(x[lo:hi], y[lo:hi], radius)
+    finally:
+        for reg in files.values():
+            reg.close()
+    # fillers, primary sources, then the other types in alphabetical order
+    return [files[code].filename for code in ['F', 'P'] + sorted(set(files) - set(['F', 'P']))]
+
+
+def compute_footprints(plot_long='No',
+                       plot_short='No',
+                       plot_msa='No',
+                       ra_long='202.47',
+                       dec_long='47.2',
+                       theta_long=0.0,
+                       dither_pattern_long='None',
+                       ra_msa='202.47',
+                       dec_msa='47.2',
+                       theta_msa=0.0,
+                       mosaic='No',
+                       usershiftv2=0.0,
+                       usershiftv3=0.0,
+                       verbose=True):
+    '''Footprint geometry, without any image, region file or display
+
+    Returns a dict with an entry for each of 'msa', 'long' and 'short' that is
+    plotted, holding
+        ra, dec  : (n_dither, n_vertex) arrays, degrees, 5 vertices per aperture
+        centre   : (ra, dec) of the pointing, degrees
+        suffix   : name of the dither pattern in the region file name
+                   (None for the MSA)'''
+    geometry = {}
+
+    #-------------------------------------------------------------------
+    #                                                                     nirspec msa
+    #   15DEC2017  I add NIRSpec slits to be plotted with the MSA and IFU
+    if plot_msa == 'Yes':
+        if verbose:
+            print('processing NIRSPEC MSA')
+            print('using NIRSpec RA  :',ra_msa)
+            print('using NIRSpec DEC :',dec_msa)
+        ra_msa, dec_msa = parse_coordinates(ra_msa, dec_msa)
+
+        # here we have msa = 4 + ifu =1 + slits = 5 total =10
+        myv2, myv3 = footprint_pointing('msa', ra_msa, dec_msa, theta_msa)
+        geometry['msa'] = dict(ra=myv2, dec=myv3, centre=(ra_msa, dec_msa),
+                               suffix=None)
+
+    #-------------------------------------------------------------------
+    # nircam long and short: every dither and mosaic position of the
+    # pattern comes out of footprint_pointing() in one pass
+    nircam = []
+    if plot_long == 'Yes':
+        nircam.append(('long', 'LWC'))
+    if plot_short == 'Yes':
+        nircam.append(('short', 'SWC'))
+
+    if nircam:
+        if verbose:
+            print('using NIRCAm RA  :',ra_long)
+            print('using NIRCam DEC :',dec_long)
+        ra_long, dec_long = parse_coordinates(ra_long, dec_long)
+
+        if mosaic == 'Yes' and not dither_pattern(dither_pattern_long)['mosaic']:
+            print('Mosaic pattern is disabled for ' + dither_pattern_long + ' dither pattern')
+            mosaic = 'No'
+        if mosaic == 'Yes':
+            suffix = 'mosaic'
+        else:
+            suffix = dither_pattern(dither_pattern_long)['suffix']
+
+    for channel, name in nircam:
+        if verbose:
+            print('processing NIRCAM ' + name)
+        myv2, myv3 = footprint_pointing(channel, ra_long, dec_long, theta_long,
+                                        dither_pattern_long, mosaic,
+                                        usershiftv2, usershiftv3)
+        geometry[channel] = dict(ra=myv2, dec=myv3, centre=(ra_long, dec_long),
+                                 suffix=suffix)
+
+    return geometry
+
+
+def create_footprint_regions(geometry, outdir, imagewcs,
+                             colmsa='red', colshort='green', collong='blue'):
+    '''Region files (ds9-<instrument>[-<pattern>].reg and the matching
+    -centre.reg) of the footprints from compute_footprints(), returns the list
+    of files written in the order they are loaded in DS9. imagewcs is the WCS
+    of the image, or 'fk5' / 'icrs' for regions in degrees (no image).'''
+    colors = {'msa': colmsa, 'long': collong, 'short': colshort}
+    regionfiles = []
+    for name in ('long', 'short', 'msa'):
+        if name not in geometry:
+            continue
+        fp = geometry[name]
+        if fp['suffix'] is None:
+            footprintname = outdir+'/ds9-' + name + '.reg'
+        else:
+            footprintname = outdir+'/ds9-' + name + '-' + fp['suffix'] + '.reg'
+        centrename = outdir+'/ds9-' + name + '-centre.reg'
+        create_footprint(
+            None,
+            fp['ra'].ravel(),
+            fp['dec'].ravel(),
+            fp['ra'].size // 5,
+            footprintname,
+            colors[name],
+            imagewcs)
+        create_footprint_center(
+            None,
+            fp['centre'][0],
+            fp['centre'][1],
+            centrename,
+            colors[name],
+            imagewcs)
+        if name == 'msa':
+            regionfiles.extend([footprintname, centrename])
+        else:
+            regionfiles.extend([centrename, footprintname])
+    return regionfiles
+
+
+def display_ds9(inputfile,
+                regionfiles,
+                ds9cmap='grey',
+                ds9limmin=0.0,
+                ds9limmax=30.0,
+                ds9scale='log',
+                ext=None):
+    '''Show the image (HDU ext only, if given) with the region files in DS9'''
+    # imported here so that the footprints can be computed on machines
+    # without DS9 / XPA
+    import pyds9
+
+    # Start xpans prior to running DS9
+    pyds9.ds9_xpans()
+
+    # Run DS9
+    d = pyds9.DS9()
+    d.set('tile yes')
+    d.set('frame 1')
+    d.set('cmap ' + ds9cmap)
+    d.set('scale limits ' + str(ds9limmin) + ' ' + str(ds9limmax))
+    d.set('scale ' + ds9scale)
+    if ext is None:
+        d.set('file ' + inputfile)
+    else:
+        d.set('file ' + inputfile + '[' + str(ext) + ']')
+    # load regions
+    for region in regionfiles:
+        d.set('regions ' + region)
+    return d
+
+
 def footprints(inputfile,
                sourcelist,
                plot_long='No',
@@ -362,7 +1039,7 @@ def footprints(inputfile,
                ra_long='202.47',
                dec_long='47.2',
                theta_long=0.0,
-               dither_pattern_long='No',
+               dither_pattern_long='None',
                ra_msa='202.47',
                dec_msa='47.2',
                theta_msa=0.0,
@@ -376,8 +1053,36 @@ def footprints(inputfile,
                ds9limmin=0.0,
                ds9limmax=30.0,
                ds9scale='log',
-               outdir='/Users/myname/Desktop/'):
-               #readfitsimage=True):
+               outdir='/Users/myname/Desktop/',
+               display='Yes',
+               cull_sources='No',
+               cache_catalog='Yes',
+               colsources=None,
+               coverage='No',
+               ext=None,
+               cutout='No',
+               coordsys='image'):
+    '''Region files of the footprints (and catalog) on the image inputfile,
+    displayed in DS9 unless display == 'No'. Returns the footprint geometry
+    of compute_footprints().
+
+    cull_sources == 'Yes' only draws the catalog sources within a cap around
+    the footprints (see footprint_cap()), instead of the whole catalog.
+    cache_catalog == 'Yes' reads the catalog from a binary copy kept in
+    CONFIG_DIR/catalogs (~/.jwst_footprints/catalogs) after the first time
+    (see catalogs.load_catalog(); catalogs.clear_cache() removes the copies).
+    colsources is a dict source type -> colour for the 3 column catalogs.
+    coverage == 'Yes' also writes coverage.fits in outdir, the number of
+    exposures covering each pixel of the image (see coverage.coverage_map()).
+    ext is the HDU of the image (index, EXTNAME or (EXTNAME, EXTVER)), by
+    default the first one with a celestial WCS; DS9 only loads that HDU.
+    cutout == 'Yes' writes cutout.fits in outdir, the part of the image the
+    footprints cover (see footprint_box()), read from the memory-mapped
+    file, and draws the regions, coverage and display on it instead of the
+    whole image.
+    coordsys 'fk5' or 'icrs' writes the regions in degrees in that system,
+    straight from the footprint coordinates; inputfile may then be None,
+    for region files only (no coverage, cutout or display).'''
 
     # verify that outdir exists
     if not os.path.exists(outdir):
@@ -387,967 +1092,58 @@ def footprints(inputfile,
     #print(outdir)
     global w
 
-    usershiftv2 = np.array(usershiftv2, np.float_)
-    usershiftv3 = np.array(usershiftv3, np.float_)
-
-    # nircam long footprint
-    ra_short = ra_long
-    dec_short = dec_long
-    theta_short = theta_long
-    dither_pattern_short = dither_pattern_long
-
-    # read image and its header
-    # need to extend this to multi extension fits files
-    # print(readfitsimage)
-    # print('reading fits')
-    hdulist = fits.open(inputfile)
-    w = wcs.WCS(hdulist[0].header)    # assuming WCS is in extension 0
-    '''
-    if readfitsimage == True:
-        print('reading fits')
-        hdulist = fits.open(inputfile)
-        w = wcs.WCS(hdulist[0].header)    # assuming WCS is in extension 0
-        readfitsimage = False 
-#        readfitsimage = False
-    '''
-
-
-    if plot_sources == 'Yes':
-        print('creating region file from source list')
-        # here we read the list ra dec and create a DS9 region file
-        data = ascii.read(sourcelist)
-        # this gives the number of columns in the input file
-        #print(len(data.colnames))
-
-        if len(data.colnames) == 2:
-            flagsources = 2
-            # in this case the user inputs ra dec
-            ra = np.array(data['col1'], np.float_)
-            dec = np.array(data['col2'], np.float_)
-            #print(ra)
-            #print(dec)
-            world = []
-            for i in range(len(ra)):
-                world.append((ra[i], dec[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(ra)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = outdir+'/ds9-sources.reg'
-            file = open(outputfile, "w")
-            file.write(
-                'global color=yellow width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(ra)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-
-        if len(data.colnames) >= 3:
-            flagsources = 3
-            # in this case the user inputs ra dec source-type
-            ra = np.array(data['col1'], np.float_)
-            dec = np.array(data['col2'], np.float_)
-            sourcetype = data['col3']
-            #print(ra)
-            #print(dec)
-            #print(sourcetype.info)
-            # select sources according to type
-            a = np.where(sourcetype == 'F')[0]  # fillers
-            rafill = ra[a]
-            decfill = dec[a]
-            a = np.where(sourcetype == 'P')[0]  # primary sources
-            rap = ra[a]
-            decp = dec[a]
-
-            # region file of fillers
-            world = []
-            for i in range(len(rafill)):
-                world.append((rafill[i], decfill[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(rafill)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = outdir+'/ds9-sources-fillers.reg'
-            file = open(outputfile, "w")
-            file.write(
-                'global color=yellow width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(rafill)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-
-            # region file of primary sources
-            world = []
-            for i in range(len(rap)):
-                world.append((rap[i], decp[i]))
-            pixcrd2 = w.wcs_world2pix(world, 1)
-            xx = []
-            yy = []
-            for i in range(len(rap)):
-                xx.append(pixcrd2[[i], 0])
-                yy.append(pixcrd2[[i], 1])
-            xwcs = np.array(xx, np.float_)
-            ywcs = np.array(yy, np.float_)
-            x = [float(i) for i in xwcs]
-            y = [float(i) for i in ywcs]
-
-            outputfile = outdir+'/ds9-sources-primary.reg'
-            file = open(outputfile, "w")
-            file.write(
-                'global color=red width=1 font="helvetica 15 normal roman"  select=0  highlite=1 \n')
-            file.write('image\n')
-            #pos = 0
-            for i in range(len(rap)):
-                c2 = "%10s" % str(x[i])
-                c3 = "%10s" % str(y[i])
-                newline = 'circle(' + c2 + ',' + c3 + ',5) # text={}' + '\n'
-                file.write(newline)
-            file.close()
-        if len(data.colnames) < 2:
-            print('Invalid input file')
-#-------------------------------------------------------------------
-    #                                                                     nirspec msa
-    #   15DEC2017  I add NIRSpec slits to be plotted with the MSA and IFU
-    if plot_msa == 'Yes':
-        print('processing NIRSPEC MSA')
-        v2msa, v3msa, aper, v2ref, v3ref = read_table(os.path.join(PKG_DATA_DIR, 'table-nirspec-msa.txt'))
-        v2msa = np.array(v2msa, np.float_)
-        v3msa = np.array(v3msa, np.float_)
-
-#---------------------------  
-#  here i need to transform ra dec to float        06JUN2017  LEONARDO
-    
-        print('using NIRSpec RA  :',ra_msa)
-        print('using NIRSpec DEC :',dec_msa)
-        
-        if (' ' in ra_msa) and (' ' in dec_msa) == True:   
-           # it recognizes that the string has the format   hh mm ss.sss
-           b = ra_msa+' '+dec_msa
-           c = SkyCoord(b,unit=(u.hourangle, u.deg))
-           #   transform to degrees to be used in the rest of the code
-           ra = c.ra.deg 
-           dec = c.dec.deg
-           ra_msa = np.array(ra, np.float_)
-           dec_msa = np.array(dec, np.float_)
-
-        
-        else:                          #   string is in units of degrees
-           ra_msa = np.array(ra_msa, np.float_)
-           dec_msa = np.array(dec_msa, np.float_)
-
-#----------------------------------------------------------------------------  
-
-
-        x2 = v2msa
-        x3 = v3msa
-        # search point in the center of each aperture
-        xmsa1 = (x2[0] + x2[2]) / 2.0
-        ymsa1 = (x3[0] + x3[2]) / 2.0
-        xmsa2 = (x2[5] + x2[7]) / 2.0
-        ymsa2 = (x3[5] + x3[7]) / 2.0
-        xmsa3 = (x2[10] + x2[12]) / 2.0
-        ymsa3 = (x3[10] + x3[12]) / 2.0
-        xmsa4 = (x2[15] + x2[17]) / 2.0
-        ymsa4 = (x3[15] + x3[17]) / 2.0
-
-        # calculate center for rotation
-        xr13 = (xmsa1 + xmsa3) / 2.0
-        yr13 = (ymsa1 + ymsa3) / 2.0
-        xr24 = (xmsa2 + xmsa4) / 2.0
-        yr24 = (ymsa2 + ymsa4) / 2.0
-        xr = (xr13 + xr24) / 2.
-        yr = (yr13 + yr24) / 2.
-
-        v2 = v2msa
-        v3 = v3msa
-        xr0 = xr
-        yr0 = yr
-        ra0 = ra_msa
-        dec0 = dec_msa 
-        pa = theta_msa - 137.4874   #  12MAR2018   NRS_FULL_MSA_V3IdlYang = 137.4874
-        myv2 = []
-        myv3 = []
-        v20 = xr0
-        v30 = yr0
-        m = attitude(v20, v30, ra0, dec0, pa)
-        for k in range(len(v2)):
-            a = pointing(m, v2[k], v3[k])
-            myv2 = np.append(myv2, a[0])
-            myv3 = np.append(myv3, a[1])
-        myv2 = np.array(myv2)
-        myv3 = np.array(myv3)
-        
-        # create_footprint(input,myv2,myv3,5,'ds9-msa.reg','red') # 10 because
-        # is includes the IFU aperture
-        # 10 because it includes the IFU aperture and the slits
-        create_footprint(
-            input, 
-            myv2, 
-            myv3, 
-            10,                                # here we have msa = 4 + ifu =1 + slits = 5 total =10 
-            outdir+'/ds9-msa.reg', 
-            colmsa)
-        create_footprint_center(
-            input,
-            ra_msa,
-            dec_msa,
-            outdir+'/ds9-msa-centre.reg',
-            colmsa)
-
-    #-------------------------------------------------------------------
-    # nircam long
-    # print plot_long
-    if plot_long == 'Yes':
-        print('processing NIRCAM LWC')
-
-
-
-#--------------------------------------------------------------------------  
-#  here i need to transform ra dec to float             06JUN2017  LEONARDO
-    
-        print('using NIRCAm RA  :',ra_long)
-        print('using NIRCam DEC :',dec_long)
-
-        if (' ' in ra_long) and (' ' in dec_long) == True:   
-           # it recognizes that the string has the format   hh mm ss.sss
-           b = ra_long+' '+dec_long
-           c = SkyCoord(b,unit=(u.hourangle, u.deg))
-           #   transform to degrees to be used in the rest of the code
-           ra = c.ra.deg 
-           dec = c.dec.deg
-           ra_long = np.array(ra, np.float_)
-           dec_long = np.array(dec, np.float_)
-
-        
-        else:                          #   string is in units of degrees
-           ra_long = np.array(ra_long, np.float_)
-           dec_long = np.array(dec_long, np.float_)
-#----------------------------------------------------------------------------  
-        create_footprint_center(
-            inputfile,
-            ra_long,
-            dec_long,
-            outdir+'/ds9-long-centre.reg',
-            collong)
-        v2c, v3c, aper, v2ref, v3ref = read_table(os.path.join(PKG_DATA_DIR, 'table-nircam-long.txt'))
-        v2_0 = np.array(v2c, np.float_)
-        v3_0 = np.array(v3c, np.float_)
-
-        if dither_pattern_long == 'None' and mosaic == 'No':
-            #shiftv2 = [0.0, -58.0,  58.0]
-            #shiftv3 = [0.0, -23.5,  23.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long + 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            # for shft in (0,1,2):
-            v20 = xr0
-            v30 = yr0
-            m = attitude(v20, v30, ra0, dec0, pa)
-            for k in range(len(v2)):
-                a = pointing(m, v2[k], v3[k])
-                myv2 = np.append(myv2, a[0])
-                myv3 = np.append(myv3, a[1])
-            myv2 = np.array(myv2)
-            myv3 = np.array(myv3)
-            create_footprint(inputfile, 
-               myv2,
-               myv3, 
-               2, 
-               outdir+'/ds9-long-no.reg', 
-               collong)
-
-        #                                                                          8NIRSPEC  29NOV2017
-        if dither_pattern_long == '8NIRSPEC':
-            mosaic == 'No'
-            shiftv2 = [-24.6, -24.4, 24.6, 24.4, 24.6, 24.4, -24.6, -24.4]
-            shiftv3 = [-64.1, -89.0, -88.8, -63.9, 64.1, 89.0, 88.8, 63.9 ]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa =  (theta_long+ 0.0265)    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            #for shft in (0, 1, 2, 4, 5, 6, 7):
-            for shft in range(len(shiftv2)):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            #print(len(myv2))    
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                16,
-                outdir+'/ds9-long-8nirspec.reg',
-                collong)
-
-
-        if dither_pattern_long == 'FULL3' and mosaic == 'No':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -23.5, 23.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                6,
-                outdir+'/ds9-long-three.reg',
-                collong)
-
-        if dither_pattern_long == 'FULL3TIGHT' and mosaic == 'No':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -7.5, 7.5]
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                6,
-                outdir+'/ds9-long-threetight.reg',
-                collong)
-
-        if dither_pattern_long == 'FULL6' and mosaic == 'No':
-            shiftv2 = [-72.0, -43.0, -14.0, 15.0, 44.0, 73.0]
-            shiftv3 = [-30.0, -18.0, -6.0, 6.0, 18.0, 30.0]
-            # determine center of rotation
-            v2 = v2_0 + 73.0
-            v3 = v3_0 + 30.0
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            v2 = v2_0 - 72.0
-            v3 = v3_0 - 30.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-
-            v2 = v2_0
-            v3 = v3_0
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2, 3, 4, 5):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                12,
-                outdir+'/ds9-long-six.reg',
-                collong)
-
-
-        if (dither_pattern_long == 'FULL3' or dither_pattern_long ==
-                'FULL3TIGHT' or dither_pattern_long == 'None') and mosaic == 'Yes':
-            if dither_pattern_long == 'FULL3':
-                shiftv3 = [0.0, -23.5, 23.5, usershiftv3 + 0.0,
-                           usershiftv3 - 23.5, usershiftv3 + 23.5]
-            if dither_pattern_long == 'FULL3TIGHT':
-                shiftv3 = [0.0, -7.5, 7.5, usershiftv3 + 0.0,
-                           usershiftv3 - 7.5, usershiftv3 + 7.5]
-
-            shiftv2 = [0.0, -58.0, 58.0, usershiftv2 + 0.0,
-                       usershiftv2 - 58.0, usershiftv2 + 58.0]
-            if (dither_pattern_long == 'None'):
-                shiftv3 = [0.0, usershiftv3 + 0.0]
-                shiftv2 = [0.0, usershiftv2 + 0.0]
-
-            v2 = v2_0
-            v3 = v3_0
-            # determine center of rotation
-            v2 = np.append(v2, v2 + usershiftv2)
-            v3 = np.append(v3, v3 + usershiftv3)
-            ascii.write([v2, v3], 'values.dat')
-
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr1 = ((xa + xb) / 2.)
-            yr1 = ((ya + yb) / 2.)
-            xa = (v2[10] + v2[12]) / 2.0
-            ya = (v3[10] + v3[12]) / 2.0
-            xb = (v2[15] + v2[17]) / 2.0
-            yb = (v3[15] + v3[17]) / 2.0
-            xr2 = ((xa + xb) / 2.)
-            yr2 = ((ya + yb) / 2.)
-
-            xr = ((xr1 + xr2) / 2.)
-            yr = ((yr1 + yr2) / 2.)
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_long
-            dec0 = dec_long
-            pa = theta_long+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in range(len(shiftv2)):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                #print(v20, v30)
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            if (dither_pattern_long == 'None'):
-                napertures = 4
-            if (dither_pattern_long ==
-                    'FULL3' or dither_pattern_long == 'FULL3TIGHT'):
-                napertures = 12
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                napertures,
-                outdir+'/ds9-long-mosaic.reg',
-                collong)
-
-
-#-------------------------------------------------------------------
-# nircam short
-    if plot_short == 'Yes':
-        print('processing NIRCAM SWC')
-       
-        v2sh, v3sh, aper, v2ref, v3ref = read_table(os.path.join(PKG_DATA_DIR, 'table-nircam-short.txt'))
-        v2sh = np.array(v2sh, np.float_)
-        v3sh = np.array(v3sh, np.float_)
-
-#--------------------------------------------------------------------------  
-#  here i need to transform ra dec to float          06JUN2017    LEONARDO
-    
-        print('using NIRCAm RA  :',ra_long)
-        print('using NIRCam DEC :',dec_long)
-        ra_short = ra_long
-        dec_short = dec_long
-
-        if (' ' in ra_long) and (' ' in dec_long) == True:   
-           # it recognizes that the string has the format   hh mm ss.sss
-           b = ra_long+' '+dec_long
-           c = SkyCoord(b,unit=(u.hourangle, u.deg))
-           #   transform to degrees to be used in the rest of the code
-           ra = c.ra.deg 
-           dec = c.dec.deg
-           ra_short = np.array(ra, np.float_)
-           dec_short = np.array(dec, np.float_)
-
-        
-        else:                          #   string is in units of degrees
-           ra_short = np.array(ra_short, np.float_)
-           dec_short = np.array(dec_short, np.float_)
-#----------------------------------------------------------------------------          
-
-        create_footprint_center(
-            inputfile,
-            ra_short,
-            dec_short,
-            outdir+'/ds9-short-centre.reg',
-            colshort)
-
-        if dither_pattern_short == 'None':
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            v20 = xr0
-            v30 = yr0
-            m = attitude(v20, v30, ra0, dec0, pa)
-            for k in range(len(v2)):
-                a = pointing(m, v2[k], v3[k])
-                myv2 = np.append(myv2, a[0])
-                myv3 = np.append(myv3, a[1])
-            myv2 = np.array(myv2)
-            myv3 = np.array(myv3)
-            #print(myv2)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                8,
-                outdir+'/ds9-short-no.reg',
-                colshort)
-
-
-        #                                                                          8NIRSPEC  15DEC2017
-        if dither_pattern_short == '8NIRSPEC' :
-            mosaic == 'No'
-            shiftv2 = [-24.6, -24.4, 24.6, 24.4, 24.6, 24.4, -24.6, -24.4]
-            shiftv3 = [-64.1, -89.0, -88.8, -63.9, 64.1, 89.0, 88.8, 63.9 ]
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in range(len(shiftv2)):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            #print(len(myv2))    
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                64,
-                outdir+'/ds9-short-8nirspec.reg',
-                colshort)
-
-
-
-        if dither_pattern_short == 'FULL3':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -23.5, 23.5]
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                24,
-                outdir+'/ds9-short-three.reg',
-                colshort)
-
-        if dither_pattern_short == 'FULL3TIGHT':
-            shiftv2 = [0.0, -58.0, 58.0]
-            shiftv3 = [0.0, -7.5, 7.5]
-            x2 = v2sh
-            x3 = v3sh
-            v2 = v2sh
-            v3 = v3sh
-            # determine center of rotation
-            # search point in the center of each aperture
-            xsh1 = (x2[0] + x2[2]) / 2.0
-            ysh1 = (x3[0] + x3[2]) / 2.0
-            xsh2 = (x2[5] + x2[7]) / 2.0
-            ysh2 = (x3[5] + x3[7]) / 2.0
-            xsh3 = (x2[20] + x2[22]) / 2.0
-            ysh3 = (x3[20] + x3[22]) / 2.0
-            xsh4 = (x2[25] + x2[27]) / 2.0
-            ysh4 = (x3[25] + x3[27]) / 2.0
-
-            # calculate center for rotation
-            xr13 = (xsh1 + xsh3) / 2.0
-            yr13 = (ysh1 + ysh3) / 2.0
-            xr24 = (xsh2 + xsh4) / 2.0
-            yr24 = (ysh2 + ysh4) / 2.0
-            xr = (xr13 + xr24) / 2.
-            yr = (yr13 + yr24) / 2.
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                24,
-                outdir+'/ds9-short-threetight.reg',
-                colshort)
-
-        if dither_pattern_short == 'FULL6':
-            shiftv2 = [-72.0, -43.0, -14.0, 15.0, 44.0, 73.0]
-            shiftv3 = [-30.0, -18.0, -6.0, 6.0, 18.0, 30.0]
-
-            # determine center of rotation using info from long dither pattern
-            v2sh, v3sh, aper, v2ref, v3ref = read_table(os.path.join(PKG_DATA_DIR, 'table-nircam-long.txt'))
-            v2sh = np.array(v2sh, np.float_)
-            v3sh = np.array(v3sh, np.float_)
-
-            v2 = v2sh + 73.0
-            v3 = v3sh + 30.0
-            xa = (v2[0] + v2[2]) / 2.0
-            ya = (v3[0] + v3[2]) / 2.0
-            v2 = v2sh - 72.0
-            v3 = v3sh - 30.0
-            xb = (v2[5] + v2[7]) / 2.0
-            yb = (v3[5] + v3[7]) / 2.0
-            xr = ((xa + xb) / 2.)
-            yr = ((ya + yb) / 2.)
-
-            v2sh, v3sh, aper, v2ref, v3ref = read_table(os.path.join(PKG_DATA_DIR, 'table-nircam-short.txt'))
-            v2sh = np.array(v2sh, np.float_)
-            v3sh = np.array(v3sh, np.float_)
-
-            v2 = v2sh
-            v3 = v3sh
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            for shft in (0, 1, 2, 3, 4, 5):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                48,
-                outdir+'/ds9-short-six.reg',
-                colshort)
-
-
-#  mosaic  short wavelength channel
-
-        if (dither_pattern_short == 'FULL3' or dither_pattern_short ==
-                'FULL3TIGHT' or dither_pattern_short == 'None') and mosaic == 'Yes':
-            if dither_pattern_short == 'FULL3':
-                shiftv3 = [0.0, -23.5, 23.5, usershiftv3 + 0.0,
-                           usershiftv3 - 23.5, usershiftv3 + 23.5]
-            if dither_pattern_short == 'FULL3TIGHT':
-                shiftv3 = [0.0, -7.5, 7.5, usershiftv3 + 0.0,
-                           usershiftv3 - 7.5, usershiftv3 + 7.5]
-
-            shiftv2 = [0.0, -58.0, 58.0, usershiftv2 + 0.0,
-                       usershiftv2 - 58.0, usershiftv2 + 58.0]
-
-            if (dither_pattern_short == 'None'):
-                shiftv3 = [0.0, usershiftv3 + 0.0]
-                shiftv2 = [0.0, usershiftv2 + 0.0]
-            v2 = v2sh
-            v3 = v3sh
-
-            # determine center of rotation
-            v2 = np.append(v2, v2 + usershiftv2)
-            v3 = np.append(v3, v3 + usershiftv3)
-            ascii.write([v2, v3], 'values.dat')
-
-            xa = (v2[0] + v2[22]) / 2.0
-            ya = (v3[0] + v3[22]) / 2.0
-            xb = (v2[8] + v2[26]) / 2.0
-            yb = (v3[8] + v3[26]) / 2.0
-            xr1 = ((xa + xb) / 2.)
-            yr1 = ((ya + yb) / 2.)
-            xa = (v2[40] + v2[62]) / 2.0
-            ya = (v3[40] + v3[62]) / 2.0
-            xb = (v2[48] + v2[66]) / 2.0
-            yb = (v3[48] + v3[66]) / 2.0
-            xr2 = ((xa + xb) / 2.)
-            yr2 = ((ya + yb) / 2.)
-
-            xr = ((xr1 + xr2) / 2.)
-            yr = ((yr1 + yr2) / 2.)
-
-            xr0 = xr
-            yr0 = yr
-            ra0 = ra_short
-            dec0 = dec_short
-            pa = theta_short+ 0.0265    #  12MAR2018  NRCALL_FULL_V2IdlYang = -0.0265
-            myv2 = []
-            myv3 = []
-            v2 = v2sh
-            v3 = v3sh
-            for shft in range(len(shiftv2)):
-                v20 = xr0 - (shiftv2[shft])  # here we shift
-                v30 = yr0 + (shiftv3[shft])  # here we shift
-                #print(v20, v30)
-                m = attitude(v20, v30, ra0, dec0, pa)
-                for k in range(len(v2)):
-                    a = pointing(m, v2[k], v3[k])
-                    myv2 = np.append(myv2, a[0])
-                    myv3 = np.append(myv3, a[1])
-                myv2 = np.array(myv2)
-                myv3 = np.array(myv3)
-            if (dither_pattern_short == 'None'):
-                napertures = 16
-            if (dither_pattern_short ==
-                    'FULL3' or dither_pattern_short == 'FULL3TIGHT'):
-                napertures = 48
-            create_footprint(
-                inputfile,
-                myv2,
-                myv3,
-                napertures,
-                outdir+'/ds9-short-mosaic.reg',
-                colshort)
-#  mosaic  short wavelength channel
-
-    # Start xpans prior to running DS9
-    pyds9.ds9_xpans()
-
-    # Run DS9
-    d = pyds9.DS9()
-    d.set('tile yes')
-    d.set('frame 1')
-    d.set('cmap ' + ds9cmap)
-    d.set('scale limits ' + ds9limmin + ' ' + ds9limmax)
-    d.set('scale ' + ds9scale)
-    d.set('file ' + inputfile)
-    # load regions
-    if plot_long == 'Yes':
-        d.set('regions ' +outdir+'/ds9-long-centre.reg')
-        if mosaic == 'No':
-            if dither_pattern_long == 'FULL3TIGHT':
-                d.set('regions ' +outdir+'/ds9-long-threetight.reg')
-            if dither_pattern_long == 'FULL3':
-                d.set('regions ' +outdir+'/ds9-long-three.reg')
-            if dither_pattern_long == '8NIRSPEC':
-                d.set('regions ' +outdir+'/ds9-long-8nirspec.reg')
-            if dither_pattern_long == 'FULL6':
-                d.set('regions ' +outdir+'/ds9-long-six.reg')
-            if dither_pattern_long == 'None':
-                d.set('regions ' +outdir+'/ds9-long-no.reg')
-        if mosaic == 'Yes' and dither_pattern_long != '8NIRSPEC' :
-            d.set('regions ' +outdir+'/ds9-long-mosaic.reg')
-        if mosaic == 'Yes' and dither_pattern_long == '8NIRSPEC' :
-            print('Mosaic pattern is disabled for 8NIRSPEC dither pattern')
-    if plot_short == 'Yes':
-        d.set('regions ' +outdir+'/ds9-short-centre.reg')
-        if mosaic == 'No':
-            if dither_pattern_short == 'FULL3TIGHT':
-                d.set('regions ' +outdir+'/ds9-short-threetight.reg')
-            if dither_pattern_short == 'FULL3':
-                d.set('regions ' +outdir+'/ds9-short-three.reg')
-            if dither_pattern_short == '8NIRSPEC':
-                d.set('regions ' +outdir+'/ds9-short-8nirspec.reg')
-            if dither_pattern_short == 'FULL6':
-                d.set('regions ' +outdir+'/ds9-short-six.reg')
-            if dither_pattern_short == 'None':
-                d.set('regions ' +outdir+'/ds9-short-no.reg')
-        if mosaic == 'Yes' and dither_pattern_short != '8NIRSPEC':
-            d.set('regions ' +outdir+'/ds9-short-mosaic.reg')
-        if mosaic == 'Yes' and dither_pattern_short == '8NIRSPEC':
-            print('Mosaic pattern is disabled for 8NIRSPEC dither pattern')
-
-    if plot_msa == 'Yes':
-        d.set('regions ' +outdir+'/ds9-msa.reg')
-        d.set('regions ' +outdir+'/ds9-msa-centre.reg')
-
+    if coordsys != 'image':
+        region_coordsys(coordsys)
+    elif inputfile is None:
+        raise ValueError('regions in image coordinates need an image (inputfile)')
+    hdu = None
+    if inputfile is not None:
+        # WCS of the image, from its header only and reused while the file is
+        # unchanged
+        hdu = images.image_hdu(inputfile, ext)
+        w = images.image_wcs(inputfile, hdu)
+    else:
+        print('no image, region files only')
+
+    geometry = compute_footprints(plot_long, plot_short, plot_msa,
+                                  ra_long, dec_long, theta_long, dither_pattern_long,
+                                  ra_msa, dec_msa, theta_msa,
+                                  mosaic, usershiftv2, usershiftv3)
+
+    if cutout == 'Yes' and inputfile is not None:
+        header = images.image_header(inputfile, hdu)
+        box = footprint_box(geometry, w, (header['NAXIS2'], header['NAXIS1']))
+        if box is None:
+            print('the footprints are not on the image, no cutout')
+        else:
+            # from here on the cutout stands for the image
+            print('cutout [{}:{}, {}:{}] of {}'.format(box[0], box[1], box[2], box[3], inputfile))
+            inputfile = images.cutout(inputfile, box, outdir+'/cutout.fits', hdu)
+            hdu = 0
+            w = images.image_wcs(inputfile, hdu)
+
+    # the WCS of the image or the sky system of the regions
+    regionwcs = w if coordsys == 'image' else coordsys
+    regionfiles = []
     if plot_sources == 'Yes':
-        if flagsources == 3:
-            #print(plot_sources)
-            d.set('regions ' +outdir+'/ds9-sources-fillers.reg')
-            d.set('regions ' +outdir+'/ds9-sources-primary.reg')
-        if flagsources == 2:
-            #print(plot_sources)
-            d.set('regions ' +outdir+'/ds9-sources.reg')
+        cap = None
+        if cull_sources == 'Yes':
+            cap = footprint_cap(geometry)
+        regionfiles = create_source_regions(sourcelist, outdir, regionwcs, cap=cap,
+                                            cache=cache_catalog, colsources=colsources)
+    regionfiles = create_footprint_regions(geometry, outdir, regionwcs,
+                                       colmsa, colshort, collong) + regionfiles
+
+    if inputfile is None:
+        return geometry
+
+    if coverage == 'Yes':
+        # imported here, the coverage module builds on this one
+        from .coverage import coverage_image
+        coverage_image(inputfile, geometry, outdir+'/coverage.fits', ext=hdu)
+
+    if display == 'Yes':
+        # the plain file name for a primary HDU image, as before
+        display_ds9(inputfile, regionfiles, ds9cmap, ds9limmin, ds9limmax, ds9scale,
+                    hdu if hdu else None)
+    return geometry
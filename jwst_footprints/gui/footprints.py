@@ -6,7 +6,7 @@ import json
 import os
 
 from .. import PKG_DATA_DIR, CONFIG_DIR, CONFIG_FILE
-from ..footprints import footprints
+from ..footprints import footprints, DITHER_PATTERNS
 from ..defaults import default_config
 from ..plot_timeline import plottimeline
 
@@ -251,7 +251,7 @@ class FootprintsUI(object):
         self.labdither.place(relx=0.02, rely=0.81, anchor="w")
         self.ditherVar = StringVar()
         self.ditherVar.set(self.config['dither'])
-        self.pt = OptionMenu(self.master, self.ditherVar, 'None', 'FULL3', 'FULL3TIGHT', 'FULL6', '8NIRSPEC')
+        self.pt = OptionMenu(self.master, self.ditherVar, *DITHER_PATTERNS)
         self.pt.place(relx=0.35, rely=0.81, anchor="w")
 
         self.labmosaic = Label(self.master, text="NIRCam mosaic")
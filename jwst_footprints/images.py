@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+FITS images the footprints are drawn on.
+
+Only the headers are read: image_wcs() parses the header of one HDU without
+touching its data (only the lookup tables of a distortion, if any, are read
+from their own HDUs) and keeps the WCS, keyed by the path, modification time
+and HDU of the file, so that drawing on the same (possibly multi-GB) mosaic
+again reuses it. A file that changes on disk is read again.
+
+The HDU is the one given (an index, an EXTNAME such as 'SCI' or an
+(EXTNAME, EXTVER) pair) or, by default, the first one with an image and a
+celestial WCS, e.g. the SCI extension of a drizzled product whose primary
+HDU only holds keywords. The headers are scanned one HDU at a time and the
+scan stops at the first match.
+
+Images with distortions (SIP, lookup tables) need the iterative
+all_world2pix() to go from the sky to pixels. inverse_grid() solves it once
+per WCS on a grid of nodes over the image and interpolates the distortion
+in between, to a given accuracy, for every later transform.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import weakref
+from functools import lru_cache
+
+import numpy as np
+from scipy import ndimage
+
+from astropy import wcs
+from astropy.io import fits
+
+# image headers and WCS kept by image_wcs()
+WCS_CACHE_SIZE = 16
+
+# accuracy of the distortion-aware transforms, pixels (as all_world2pix())
+WORLD2PIX_TOLERANCE = 1e-4
+# nodes per axis of the first and of the finest inverse grid, and the margin
+# of the grid around the image, as a fraction of its size
+GRID_NODES = 17
+GRID_MAX_NODES = 1025
+GRID_MARGIN = 0.1
+# nodes continuing the grid on each side, so that the splines have no edge effects
+GRID_PAD = 12
+
+# inverse grids of the WCS in use, per tolerance
+_inverse_grids = weakref.WeakKeyDictionary()
+
+
+def has_celestial_image(header, fobj=None):
+    '''True if the header is that of an image (at least 2 axes) with a
+    celestial WCS; fobj is the HDUList of the file, needed for the lookup
+    table distortions (CPDIS, D2IMDIS) that are stored in other HDUs'''
+    if header.get('NAXIS', 0) < 2:
+        return False
+    return wcs.WCS(header, fobj).has_celestial
+
+
+@lru_cache(maxsize=WCS_CACHE_SIZE)
+def _find_hdu(path, mtime, ext):
+    # the HDUs are only parsed up to the one asked for
+    with fits.open(path, lazy_load_hdus=True) as hdulist:
+        if ext is not None:
+            # IndexError / KeyError if the file has no such HDU
+            return hdulist.index_of(hdulist[ext])
+        for index, hdu in enumerate(hdulist):
+            if has_celestial_image(hdu.header, hdulist):
+                return index
+    raise ValueError('no image with a celestial WCS in ' + path)
+
+
+@lru_cache(maxsize=WCS_CACHE_SIZE)
+def _read_wcs(path, mtime, ext):
+    # the lookup tables of the distortion are read from their own HDUs
+    with fits.open(path, lazy_load_hdus=True) as hdulist:
+        header = hdulist[ext].header
+        return (header, wcs.WCS(header, hdulist))
+
+
+def _key(filename, ext):
+    path = os.path.abspath(filename)
+    mtime = os.stat(path).st_mtime_ns
+    if isinstance(ext, list):
+        ext = tuple(ext)
+    return (path, mtime, _find_hdu(path, mtime, ext))
+
+
+def image_hdu(filename, ext=None):
+    '''Index of the HDU ext of a FITS file (index, EXTNAME or (EXTNAME,
+    EXTVER)), by default of the first image with a celestial WCS'''
+    return _key(filename, ext)[2]
+
+
+def image_header(filename, ext=None):
+    '''Header of HDU ext of a FITS file (see image_hdu()), read once per file
+    version (shared: copy it before changing it)'''
+    return _read_wcs(*_key(filename, ext))[0]
+
+
+def image_wcs(filename, ext=None):
+    '''WCS of HDU ext of a FITS file (see image_hdu()), from its header only,
+    built once per file version (shared: copy it before changing it)'''
+    return _read_wcs(*_key(filename, ext))[1]
+
+
+def clear_cache():
+    '''Forget the headers, WCS and inverse grids computed so far'''
+    _find_hdu.cache_clear()
+    _read_wcs.cache_clear()
+    _inverse_grids.clear()
+
+
+def _distortion(imagewcs, x0, y0, tolerance):
+    # true minus undistorted pixel positions at the undistorted positions x0, y0
+    ra, dec = imagewcs.wcs_pix2world(x0, y0, 1)
+    x, y = imagewcs.all_world2pix(ra, dec, 1, tolerance=tolerance, quiet=True)
+    return (x - x0, y - y0)
+
+
+def _continue(values, pad):
+    # pad nodes on each side of a 2-d grid, continuing it as a cubic (constant
+    # third differences) rather than evaluating the WCS far off the image
+    for axis in (0, 1):
+        values = np.moveaxis(values, axis, 0)
+        for _ in range(pad):
+            after = 4.0 * values[-1] - 6.0 * values[-2] + 4.0 * values[-3] - values[-4]
+            before = 4.0 * values[0] - 6.0 * values[1] + 4.0 * values[2] - values[3]
+            values = np.concatenate([before[np.newaxis], values, after[np.newaxis]])
+        values = np.moveaxis(values, 0, axis)
+    return values
+
+
+class InverseGrid(object):
+    '''Distortion of a WCS on a regular grid of undistorted pixel positions
+    (those of wcs_world2pix(), 1-based), for the inverse transform
+
+    The distortion (true minus undistorted position, from all_world2pix()) is
+    computed at the nodes of a grid spanning the image and a margin
+    GRID_MARGIN around it, and interpolated with cubic splines (the grid is
+    continued by GRID_PAD nodes on each side for the splines). The grid
+    starts with GRID_NODES nodes per axis and is refined (doubled) until the
+    interpolation is within tolerance pixels halfway between the nodes, or
+    GRID_MAX_NODES is reached. The WCS itself is not kept.'''
+
+    def __init__(self, imagewcs, tolerance=WORLD2PIX_TOLERANCE):
+        self.tolerance = tolerance
+        nx, ny = imagewcs.pixel_shape
+        self.lo = np.array([1.0 - GRID_MARGIN * nx, 1.0 - GRID_MARGIN * ny])
+        self.hi = np.array([nx + GRID_MARGIN * nx, ny + GRID_MARGIN * ny])
+        nodes = GRID_NODES
+        while True:
+            self.step = (self.hi - self.lo) / (nodes - 1)
+            x0, y0 = np.meshgrid(np.linspace(self.lo[0], self.hi[0], nodes),
+                                 np.linspace(self.lo[1], self.hi[1], nodes))
+            dx, dy = _distortion(imagewcs, x0, y0, tolerance / 10.0)
+            if not (np.isfinite(dx).all() and np.isfinite(dy).all()):
+                raise ValueError('the distortion cannot be inverted over the image')
+            self.coefficients = [ndimage.spline_filter(_continue(d, GRID_PAD), order=3)
+                                 for d in (dx, dy)]
+
+            # the interpolation is worst in the middle of the cells
+            xm = x0[:-1, :-1] + self.step[0] / 2.0
+            ym = y0[:-1, :-1] + self.step[1] / 2.0
+            dx, dy = _distortion(imagewcs, xm, ym, tolerance / 10.0)
+            ix, iy = self.interpolate(xm, ym)
+            self.error = np.hypot(ix - dx, iy - dy).max()
+            if self.error <= tolerance or nodes >= GRID_MAX_NODES:
+                break
+            nodes = 2 * nodes - 1
+        self.nodes = nodes
+
+    def __repr__(self):
+        return '<InverseGrid: %dx%d nodes, error %.2g pixel>' % (self.nodes, self.nodes, self.error)
+
+    def interpolate(self, x0, y0):
+        '''Distortion dx, dy at undistorted positions x0, y0 on the grid'''
+        coordinates = [(y0 - self.lo[1]) / self.step[1] + GRID_PAD,
+                       (x0 - self.lo[0]) / self.step[0] + GRID_PAD]
+        return [ndimage.map_coordinates(c, coordinates, order=3, prefilter=False)
+                for c in self.coefficients]
+
+    def inside(self, x0, y0):
+        '''True for the undistorted positions on the grid'''
+        return (x0 >= self.lo[0]) & (x0 <= self.hi[0]) & (y0 >= self.lo[1]) & (y0 <= self.hi[1])
+
+    def world2pix(self, imagewcs, ra, dec):
+        '''Pixel positions (1-based) of ra, dec (degrees, arrays of the same
+        shape) on the image of imagewcs, the WCS the grid was made from: the
+        undistorted positions plus the interpolated distortion, the iterative
+        solution of all_world2pix() off the grid'''
+        x, y = imagewcs.wcs_world2pix(ra, dec, 1)
+        x = np.array(x, np.float64)
+        y = np.array(y, np.float64)
+        inside = self.inside(x, y)
+        dx, dy = self.interpolate(x[inside], y[inside])
+        x[inside] += dx
+        y[inside] += dy
+        outside = ~inside & np.isfinite(x) & np.isfinite(y)
+        if outside.any():
+            x[outside], y[outside] = imagewcs.all_world2pix(
+                ra[outside], dec[outside], 1, tolerance=self.tolerance, quiet=True)
+        return (x, y)
+
+
+def inverse_grid(imagewcs, tolerance=WORLD2PIX_TOLERANCE):
+    '''InverseGrid of a WCS with distortions, made once per WCS and
+    tolerance. None if the WCS has no image size or its distortion cannot
+    be inverted all over the grid: all_world2pix() is then the way.'''
+    if imagewcs.pixel_shape is None:
+        return None
+    grids = _inverse_grids.setdefault(imagewcs, {})
+    if tolerance not in grids:
+        try:
+            grids[tolerance] = InverseGrid(imagewcs, tolerance)
+        except ValueError:
+            grids[tolerance] = None
+    return grids[tolerance]
+
+
+def _lookup_tables(header, hdulist, xmin, ymin):
+    # HDUs of the lookup tables of the distortions (CPDIS, D2IMDIS) of header,
+    # their reference (CRVAL, in image pixels) moved to a cutout at xmin, ymin
+    offset = {1: xmin, 2: ymin}
+    tables = {}
+    for distortion, record, extname in (('CPDIS', 'DP', 'WCSDVARR'),
+                                        ('D2IMDIS', 'D2IM', 'D2IMARR')):
+        for j in (1, 2):
+            if str(header.get(distortion + str(j), '')).strip().upper() != 'LOOKUP':
+                continue
+            prefix = record + str(j) + '.'
+            key = (extname, int(header[prefix + 'EXTVER']))
+            if key in tables:
+                continue
+            table = hdulist[key]
+            table = fits.ImageHDU(np.array(table.data), table.header.copy())
+            for k in range(1, table.header['NAXIS'] + 1):
+                axis = int(header.get(prefix + 'AXIS.' + str(k), k))
+                crval = 'CRVAL' + str(k)
+                table.header[crval] = table.header.get(crval, 0.0) - offset[axis]
+            tables[key] = table
+    return list(tables.values())
+
+
+def cutout(filename, box, outfile, ext=None):
+    '''Write the pixels box = (xmin, xmax, ymin, ymax) (0-based, end excluded,
+    as slices) of HDU ext of a FITS image (see image_hdu()) to outfile, with
+    the header of the image and its reference pixel moved to the cutout
+    (and the lookup tables of its distortion, if any, with it).
+    Only the rows of the box are read, from the memory-mapped file, and the
+    pixel values are copied unscaled (BSCALE/BZERO/BLANK are kept).
+    Returns outfile.'''
+    index = image_hdu(filename, ext)
+    xmin, xmax, ymin, ymax = [int(v) for v in box]
+    header = image_header(filename, index).copy()
+    with fits.open(filename, memmap=True, lazy_load_hdus=True,
+                   do_not_scale_image_data=True) as hdulist:
+        data = np.array(hdulist[index].section[..., ymin:ymax, xmin:xmax])
+        tables = _lookup_tables(header, hdulist, xmin, ymin)
+    header['CRPIX1'] = header.get('CRPIX1', 0.0) - xmin
+    header['CRPIX2'] = header.get('CRPIX2', 0.0) - ymin
+    hdu = fits.PrimaryHDU(data, header)
+    # the new HDU drops the scaling of the header, put it back on the raw values
+    for key in ('BSCALE', 'BZERO', 'BLANK'):
+        if key in header:
+            hdu.header[key] = header[key]
+    fits.HDUList([hdu] + tables).writeto(outfile, overwrite=True, output_verify='silentfix')
+    return outfile
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Search of the NIRSpec MSA pointing (RA/Dec offset and aperture position
+angle) around a nominal one that puts the most catalog sources in the four
+MSA quadrants, primary (P) sources counting more than fillers (F).
+
+The quadrant edges are fixed great circles in the V2/V3 frame, so a
+candidate attitude only has to rotate their normals to the sky; a source is
+in a quadrant when it is on the inner side of its four edges. Batches of
+candidates are scored against all sources at once. The search starts on a
+coarse grid of offsets and position angles and refines around the best
+candidates, halving the step at each level.
+
+    ra, dec, sourcetype = catalogs.read_catalog('sources.radec')
+    best = optimize_msa_pointing(ra, dec, sourcetype, 53.16, -27.78, 40.0)
+    best['ra'], best['dec'], best['theta'], best['counts']
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+from .footprints import (attitude, get_aperture, in_cap, msa_quadrants, parse_coordinates,
+                         unit)
+from .sourceindex import edge_normals
+
+WEIGHTS = {'P': 10.0, 'F': 1.0}
+
+# source x candidate tests per block
+BLOCKSIZE = 1 << 22
+
+
+def quadrant_normals():
+    '''Inward edge normals (4 quadrants, 4 edges, 3) of the MSA quadrants, in
+    the V2/V3 frame'''
+    template = get_aperture('msa')
+    quadrants = msa_quadrants()
+    # the 4 distinct vertices of each closed polygon
+    v2 = template.v2.reshape(-1, 5)[quadrants, :4]
+    v3 = template.v3.reshape(-1, 5)[quadrants, :4]
+    vertices = np.moveaxis(unit(v2 / 3600.0, v3 / 3600.0), 0, -1)
+    return edge_normals(vertices)
+
+
+def quadrant_radius():
+    '''Largest distance (arcsec) of a quadrant vertex from the MSA reference
+    point, i.e. the radius of the circle the quadrants sweep at any PA'''
+    template = get_aperture('msa')
+    quadrants = msa_quadrants()
+    v2 = template.v2.reshape(-1, 5)[quadrants, :4]
+    v3 = template.v3.reshape(-1, 5)[quadrants, :4]
+    return np.sqrt((v2 - template.xr)**2 + (v3 - template.yr)**2).max()
+
+
+def score_pointings(xyz, weights, ra, dec, theta, normals=None):
+    '''Weighted number of sources in the MSA quadrants for candidate MSA
+    pointings ra, dec, theta (degrees, arrays of the same shape)
+
+    xyz     : (n_source, 3) source unit vectors
+    weights : (n_source,) weight of each source'''
+    template = get_aperture('msa')
+    if normals is None:
+        normals = quadrant_normals()
+    ra = np.asarray(ra, np.float64)
+    m = attitude(template.xr, template.yr, ra.ravel(), np.ravel(dec),
+                 np.ravel(theta) + template.pa_offset)
+    # (n_quadrant, n_edge, 3, n_candidate): the edge normals of every candidate on the sky
+    ncand = len(m)
+    sky = np.ascontiguousarray(np.einsum('cij,qej->qeic', m, normals))
+
+    score = np.zeros(ncand)
+    step = max(1, BLOCKSIZE // ncand)
+    for start in range(0, len(xyz), step):
+        block = xyz[start:start + step]
+        # inside one of the quadrants = on the inner side of its 4 edges
+        inside = np.zeros((len(block), ncand), bool)
+        for edges in sky:
+            inquadrant = np.dot(block, edges[0]) >= 0.0
+            for edge in edges[1:]:
+                inquadrant &= np.dot(block, edge) >= 0.0
+            inside |= inquadrant
+        score += np.dot(weights[start:start + step], inside)
+    return score.reshape(ra.shape)
+
+
+def unique_candidates(dx, dy, dpa, decimals=9):
+    '''Candidate offsets dx, dy, dpa with the repeated ones (to decimals
+    places, the grids of neighbouring candidates overlapping) removed'''
+    keys = np.round(np.stack([dx, dy, dpa], axis=1), decimals)
+    index = np.sort(np.unique(keys, axis=0, return_index=True)[1])
+    return (dx[index], dy[index], dpa[index])
+
+
+def optimize_msa_pointing(ra, dec, sourcetype, ra_msa, dec_msa, theta_msa,
+                          weights=None, max_offset=30.0, max_dpa=5.0,
+                          ngrid=11, nrefine=5, keep=8, levels=5, verbose=True):
+    '''Best MSA pointing within max_offset arcsec (east and north) and
+    max_dpa degrees of ra_msa, dec_msa, theta_msa
+
+    ra, dec    : source positions, degrees
+    sourcetype : source types (P, F, ...) or None to count every source once
+    weights    : dict type -> weight, default WEIGHTS; other types count 0
+
+    The first level is a grid of ngrid offsets in RA, Dec and PA; every
+    following level is a grid of nrefine points at half the step around
+    each of the keep best distinct candidates so far, each candidate being
+    scored once per level.
+    With the defaults the last step is 0.375 arcsec and 0.0625 degrees, the
+    resolution of a full grid of about 4 million attitudes, for about 5000
+    evaluated.
+    Returns a dict with ra, dec, theta, offset (arcsec east, north, degrees)
+    score and counts (per source type in the quadrants, weighted or not) of
+    the best pointing,
+    nominal, the score of the nominal pointing, and evaluated, the number of
+    candidates scored.'''
+    ra_msa, dec_msa = parse_coordinates(ra_msa, dec_msa)
+    theta_msa = float(theta_msa)
+    if weights is None:
+        weights = WEIGHTS
+    ra = np.atleast_1d(np.asarray(ra, np.float64))
+    dec = np.atleast_1d(np.asarray(dec, np.float64))
+    if sourcetype is None:
+        sourcetype = np.full(len(ra), 'all')
+        w = np.ones(len(ra))
+    else:
+        sourcetype = np.asarray(sourcetype)
+        w = np.zeros(len(ra))
+        for code, weight in weights.items():
+            w[sourcetype == code] = weight
+
+    # only the sources the quadrants can reach at any candidate, and only
+    # those that count for the score
+    radius = (quadrant_radius() + max_offset * np.sqrt(2.0)) / 3600.0
+    near = in_cap(ra, dec, (ra_msa, dec_msa, radius))
+    xyznear = np.ascontiguousarray(unit(ra[near], dec[near]).T)
+    weighted = w[near] != 0.0
+    xyz = np.ascontiguousarray(xyznear[weighted])
+    w = w[near][weighted]
+    normals = quadrant_normals()
+    cosdec = np.cos(np.radians(dec_msa))
+
+    def evaluate(dx, dy, dpa):
+        return score_pointings(xyz, w, ra_msa + dx / 3600.0 / cosdec,
+                               dec_msa + dy / 3600.0, theta_msa + dpa, normals)
+
+    offsets = np.linspace(-max_offset, max_offset, ngrid)
+    angles = np.linspace(-max_dpa, max_dpa, ngrid)
+    dx, dy, dpa = [g.ravel() for g in np.meshgrid(offsets, offsets, angles, indexing='ij')]
+    step = np.array([offsets[1] - offsets[0], angles[1] - angles[0]]) if ngrid > 1 else np.zeros(2)
+    score = evaluate(dx, dy, dpa)
+    nevaluated = len(score)
+    if verbose:
+        print('optimizing MSA pointing: {} sources, level 0 best score {}'.format(len(w), score.max()))
+
+    # always with the centre, the best candidates carry over to the next level
+    grid = np.union1d(np.linspace(-1.0, 1.0, nrefine), [0.0])
+    for level in range(1, levels):
+        best = np.argsort(score)[::-1][:keep]
+        # a grid spanning one step on each side of each of the best candidates
+        # (its centre is the candidate itself)
+        gx, gy, gpa = [g.ravel() for g in np.meshgrid(grid * step[0], grid * step[0],
+                                                     grid * step[1], indexing='ij')]
+        dx = (dx[best][:, np.newaxis] + gx).ravel()
+        dy = (dy[best][:, np.newaxis] + gy).ravel()
+        dpa = (dpa[best][:, np.newaxis] + gpa).ravel()
+        inrange = (np.abs(dx) <= max_offset) & (np.abs(dy) <= max_offset) & (np.abs(dpa) <= max_dpa)
+        dx, dy, dpa = unique_candidates(dx[inrange], dy[inrange], dpa[inrange])
+        score = evaluate(dx, dy, dpa)
+        nevaluated += len(score)
+        step = step / 2.0
+        if verbose:
+            print('level {} best score {}'.format(level, score.max()))
+
+    # ties go to the candidate closest to the nominal pointing
+    ibest = np.lexsort((np.hypot(dx, dy), -score))[0]
+    best = dict(ra=ra_msa + dx[ibest] / 3600.0 / cosdec,
+                dec=dec_msa + dy[ibest] / 3600.0,
+                theta=theta_msa + dpa[ibest],
+                offset=(dx[ibest], dy[ibest], dpa[ibest]),
+                score=score[ibest],
+                nominal=evaluate(np.zeros(1), np.zeros(1), np.zeros(1))[0],
+                evaluated=nevaluated)
+
+    # sources of each type in the quadrants at the best pointing, including
+    # the types that do not count for the score
+    counts = {}
+    types = sourcetype[near]
+    for code in np.unique(types):
+        sel = types == code
+        counts[code] = int(score_pointings(xyznear[sel], np.ones(sel.sum()),
+                                           best['ra'], best['dec'], best['theta'],
+                                           normals))
+    best['counts'] = counts
+    return best
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Overlap of the NIRCam footprint with the NIRSpec MSA quadrants, the
+fraction of each quadrant that a NIRCam pre-imaging pointing covers.
+
+The apertures are projected on the plane tangent to the sky at the MSA
+pointing, where their edges are straight, and every NIRCam detector is
+clipped against every MSA quadrant (Sutherland-Hodgman, both polygons being
+convex). All the clips of a batch of NIRCam pointings, relative position
+angles and offsets are done together, one quadrant edge at a time.
+
+The dither positions overlap each other, so the fraction covered by the
+whole pattern is not a sum of the per-dither fractions: nircam_msa_union()
+integrates it along scanlines across each quadrant, where every detector at
+every dither position covers one interval and the intervals are merged.
+
+    dpa = np.arange(-30., 30.1, 0.5)
+    fraction = nircam_msa_overlap(53.16, -27.78, 40.0, dpa=dpa, pattern='FULL3')
+    fraction.shape                  # (121, 3 dithers, 4 quadrants)
+    union = nircam_msa_union(53.16, -27.78, 40.0, dpa=dpa, pattern='FULL3')
+    union.shape                     # (121, 4 quadrants)
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+from .footprints import (dither_reference, footprint_pointing, get_aperture, msa_quadrants,
+                         parse_coordinates, tangent_plane)
+
+# polygon clips per batch
+BLOCKSIZE = 1 << 16
+# scanlines across each quadrant for nircam_msa_union()
+UNION_LINES = 256
+
+
+def polygon_area(xy, n=None):
+    '''Signed area (positive counter-clockwise) of polygons xy (..., k, 2),
+    of which the first n (...) vertices are used (default: all k)'''
+    k = xy.shape[-2]
+    index = np.arange(k)
+    if n is None:
+        n = np.full(xy.shape[:-2], k)
+    n = np.asarray(n)[..., np.newaxis]
+    following = np.where(index >= n - 1, 0, index + 1)
+    x = xy[..., 0]
+    y = xy[..., 1]
+    xn = np.take_along_axis(x, np.broadcast_to(following, x.shape), axis=-1)
+    yn = np.take_along_axis(y, np.broadcast_to(following, y.shape), axis=-1)
+    return 0.5 * np.where(index < n, x * yn - xn * y, 0.0).sum(axis=-1)
+
+
+def clip_polygons(subject, clip):
+    '''Intersections of convex polygons subject (..., k, 2) and clip (..., m, 2),
+    whose leading axes broadcast together.
+    Returns (xy, n): the vertices (..., k + m, 2) of each intersection, of
+    which the first n (...) are used (n = 0 for no intersection).'''
+    subject = np.asarray(subject, np.float64)
+    clip = np.asarray(clip, np.float64)
+    shape = np.broadcast(np.empty(subject.shape[:-2]), np.empty(clip.shape[:-2])).shape
+    k = subject.shape[-2]
+    m = clip.shape[-2]
+    size = k + m
+    xy = np.zeros(shape + (size, 2))
+    xy[..., :k, :] = subject
+    n = np.full(shape, k)
+    index = np.arange(size)
+    # inner side of the clip edges whatever the order of the clip vertices
+    orient = np.sign(polygon_area(clip))[..., np.newaxis]
+
+    for j in range(m):
+        a = clip[..., j, np.newaxis, :]
+        b = clip[..., (j + 1) % m, np.newaxis, :]
+        previous = np.where(index == 0, n[..., np.newaxis] - 1, index - 1)
+        prev = np.take_along_axis(xy, np.broadcast_to(previous[..., np.newaxis], xy.shape), axis=-2)
+        valid = index < n[..., np.newaxis]
+        # distance (times the edge length) to the inner side of the edge a-b
+        edge = b - a
+        scur = orient * (edge[..., 0] * (xy[..., 1] - a[..., 1]) - edge[..., 1] * (xy[..., 0] - a[..., 0]))
+        sprev = orient * (edge[..., 0] * (prev[..., 1] - a[..., 1]) - edge[..., 1] * (prev[..., 0] - a[..., 0]))
+        crossing = valid & (((sprev > 0) & (scur < 0)) | ((sprev < 0) & (scur > 0)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(crossing, sprev / (sprev - scur), 0.0)
+        point = prev + t[..., np.newaxis] * (xy - prev)
+
+        # each vertex gives the crossing into/out of the edge, then itself if inside
+        candidates = np.stack([point, xy], axis=-2).reshape(shape + (2 * size, 2))
+        keep = np.stack([crossing, valid & (scur >= 0)], axis=-1).reshape(shape + (2 * size,))
+        order = np.argsort(~keep, axis=-1, kind='stable')[..., :size]
+        xy = np.take_along_axis(candidates, np.broadcast_to(order[..., np.newaxis], shape + (size, 2)), axis=-2)
+        n = keep.sum(axis=-1)
+    return (xy, n)
+
+
+def line_intervals(xy, yline):
+    '''Intervals (xmin, xmax) cut by the horizontal lines y = yline (...) from
+    convex polygons xy (..., k, 2) broadcasting with them, (inf, -inf) where a
+    line misses a polygon'''
+    x = xy[..., 0]
+    y = xy[..., 1]
+    xn = np.roll(x, -1, axis=-1)
+    yn = np.roll(y, -1, axis=-1)
+    yline = np.asarray(yline)[..., np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (yline - y) / (yn - y)
+        xc = x + t * (xn - x)
+    # horizontal edges and repeated (closing) vertices cross nothing
+    crosses = (t >= 0.0) & (t <= 1.0) & (yn != y)
+    return (np.where(crosses, xc, np.inf).min(axis=-1),
+            np.where(crosses, xc, -np.inf).max(axis=-1))
+
+
+def union_length(xmin, xmax):
+    '''Length of the union of the intervals (xmin, xmax) along the last axis,
+    empty intervals having xmin >= xmax'''
+    empty = xmin >= xmax
+    xmin = np.where(empty, np.inf, xmin)
+    xmax = np.where(empty, -np.inf, xmax)
+    order = np.argsort(xmin, axis=-1)
+    xmin = np.take_along_axis(xmin, order, axis=-1)
+    xmax = np.take_along_axis(xmax, order, axis=-1)
+    # the part of each interval beyond the end of the ones starting before it
+    reach = np.maximum.accumulate(xmax, axis=-1)
+    reach = np.concatenate([np.full(reach.shape[:-1] + (1,), -np.inf), reach[..., :-1]], axis=-1)
+    return np.maximum(xmax - np.maximum(xmin, reach), 0.0).sum(axis=-1)
+
+
+def quadrant_polygons(ra_msa, dec_msa, theta_msa):
+    '''Vertices (4 quadrants, 4 vertices, 2) of the MSA quadrants, in arcsec
+    on the tangent plane at the MSA pointing ra_msa, dec_msa (degrees) with
+    aperture position angle theta_msa'''
+    quadrants = msa_quadrants()
+    ra, dec = footprint_pointing('msa', ra_msa, dec_msa, theta_msa)
+    xi, eta = tangent_plane(ra[0].reshape(-1, 5)[quadrants, :4],
+                            dec[0].reshape(-1, 5)[quadrants, :4], ra_msa, dec_msa)
+    return np.stack([xi, eta], axis=-1)
+
+
+def nircam_msa_overlap(ra_msa, dec_msa, theta_msa, dpa=0.0, dx=0.0, dy=0.0,
+                       channel='short', pattern='None', mosaic='No',
+                       usershiftv2=0.0, usershiftv3=0.0):
+    '''Fraction of each MSA quadrant covered by the NIRCam detectors of channel
+    ('short' or 'long') at every position of a dither pattern
+
+    The MSA is pointed at ra_msa, dec_msa with aperture position angle
+    theta_msa. NIRCam is pointed dx, dy arcsec (east, north) away with aperture
+    position angle theta_msa + dpa; dpa, dx and dy are numbers or arrays that
+    broadcast together to a shape S.
+    Returns an array of shape S + (n_dither, 4 quadrants), the fraction of
+    each quadrant covered at each dither position separately; the fraction
+    covered by the whole pattern is nircam_msa_union().'''
+    ra_msa, dec_msa = parse_coordinates(ra_msa, dec_msa)
+    clip = quadrant_polygons(ra_msa, dec_msa, theta_msa)
+    area = np.abs(polygon_area(clip))
+
+    dpa, dx, dy = np.broadcast_arrays(*[np.asarray(v, np.float64) for v in (dpa, dx, dy)])
+    shape = dpa.shape
+    dpa, dx, dy = dpa.ravel(), dx.ravel(), dy.ravel()
+    ndetector = get_aperture(channel).napertures
+    nquadrant = len(clip)
+    step = max(1, BLOCKSIZE // (ndetector * nquadrant * 8))
+
+    if len(dpa) == 0:
+        ndither = len(dither_reference(channel, pattern, mosaic, usershiftv2, usershiftv3)[0])
+        return np.zeros(shape + (ndither, nquadrant))
+
+    fraction = []
+    cosdec = np.cos(np.radians(dec_msa))
+    for start in range(0, len(dpa), step):
+        sl = slice(start, start + step)
+        ra, dec = footprint_pointing(channel, ra_msa + dx[sl] / 3600.0 / cosdec,
+                                     dec_msa + dy[sl] / 3600.0, theta_msa + dpa[sl],
+                                     pattern, mosaic, usershiftv2, usershiftv3)
+        # (pointing, dither, detector, 4 vertices, 2)
+        ndither = ra.shape[1]
+        xi, eta = tangent_plane(ra.reshape(ra.shape[:2] + (ndetector, 5))[..., :4],
+                                dec.reshape(ra.shape[:2] + (ndetector, 5))[..., :4],
+                                ra_msa, dec_msa)
+        subject = np.stack([xi, eta], axis=-1)[..., np.newaxis, :, :]
+        xy, n = clip_polygons(subject, clip)
+        # detectors do not overlap: sum their shares of each quadrant
+        covered = np.abs(polygon_area(xy, n)).sum(axis=2)
+        fraction.append(covered / area)
+    return np.concatenate(fraction).reshape(shape + (ndither, nquadrant))
+
+
+def nircam_msa_union(ra_msa, dec_msa, theta_msa, dpa=0.0, dx=0.0, dy=0.0,
+                     channel='short', pattern='None', mosaic='No',
+                     usershiftv2=0.0, usershiftv3=0.0, nline=UNION_LINES):
+    '''Fraction of each MSA quadrant covered by the NIRCam detectors of channel
+    at any position of a dither pattern (the union of the dither positions),
+    for the same pointings as nircam_msa_overlap()
+
+    Each quadrant is crossed by nline equally spaced scanlines; on each the
+    detectors at all dither positions cover intervals, cut to the quadrant,
+    whose union is measured. The fraction is the covered length summed over
+    the lines over the quadrant length summed over the lines, accurate to
+    about 1 / nline**2.
+    Returns an array of shape S + (4 quadrants).'''
+    ra_msa, dec_msa = parse_coordinates(ra_msa, dec_msa)
+    clip = quadrant_polygons(ra_msa, dec_msa, theta_msa)
+    nquadrant = len(clip)
+
+    # (quadrant, line): scanlines in the middle of nline bands over each quadrant
+    lo = clip[..., 1].min(axis=1)[:, np.newaxis]
+    hi = clip[..., 1].max(axis=1)[:, np.newaxis]
+    yline = lo + (hi - lo) * (np.arange(nline) + 0.5) / nline
+    qmin, qmax = line_intervals(clip[:, np.newaxis], yline)
+    qlength = np.maximum(qmax - qmin, 0.0).sum(axis=1)
+
+    dpa, dx, dy = np.broadcast_arrays(*[np.asarray(v, np.float64) for v in (dpa, dx, dy)])
+    shape = dpa.shape
+    dpa, dx, dy = dpa.ravel(), dx.ravel(), dy.ravel()
+    if len(dpa) == 0:
+        return np.zeros(shape + (nquadrant,))
+    ndither = len(dither_reference(channel, pattern, mosaic, usershiftv2, usershiftv3)[0])
+    npolygon = ndither * get_aperture(channel).napertures
+    step = max(1, BLOCKSIZE // (nquadrant * nline * npolygon))
+
+    fraction = []
+    cosdec = np.cos(np.radians(dec_msa))
+    for start in range(0, len(dpa), step):
+        sl = slice(start, start + step)
+        ra, dec = footprint_pointing(channel, ra_msa + dx[sl] / 3600.0 / cosdec,
+                                     dec_msa + dy[sl] / 3600.0, theta_msa + dpa[sl],
+                                     pattern, mosaic, usershiftv2, usershiftv3)
+        # (pointing, 1, 1, detector at every dither position, 4 vertices, 2)
+        xi, eta = tangent_plane(ra.reshape(-1, npolygon, 5)[..., :4],
+                                dec.reshape(-1, npolygon, 5)[..., :4], ra_msa, dec_msa)
+        subject = np.stack([xi, eta], axis=-1)[:, np.newaxis, np.newaxis]
+        xmin, xmax = line_intervals(subject, yline[..., np.newaxis])
+        # (pointing, quadrant, line, polygon) intervals cut to the quadrant
+        xmin = np.maximum(xmin, qmin[..., np.newaxis])
+        xmax = np.minimum(xmax, qmax[..., np.newaxis])
+        fraction.append(union_length(xmin, xmax).sum(axis=-1) / qlength)
+    return np.concatenate(fraction).reshape(shape + (nquadrant,))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+DS9 region files written from whole coordinate arrays.
+
+Each call formats a block of shapes with a single string operation and
+writes it in large chunks, instead of building and writing one line at a
+time, so that region files of millions of catalog sources are written in
+seconds.
+
+    with RegionFile('ds9-sources.reg', color='yellow') as reg:
+        reg.circles(x, y, radius=5)
+        reg.circles(xp, yp, radius=5, color='red')   # one colour per group
+
+Coordinates are written with repr(), i.e. the shortest string that reads
+back as the same float.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+# lines formatted per string operation / bytes buffered per write
+CHUNKSIZE = 65536
+BUFSIZE = 1 << 20
+
+HEADER = 'global color={} width=1 font="helvetica 15 normal roman"   select=0 highlite=1 \n'
+
+
+class RegionFile(object):
+    '''DS9 region file, opened for writing
+
+    filename : output file name
+    color    : global colour of the shapes
+    coordsys : DS9 coordinate system of the shapes, 'image' for pixels or a
+               sky system ('fk5', 'icrs') for degrees
+
+    The shape methods take arrays of coordinates and an optional colour,
+    either one name for the whole group or one name per shape.'''
+
+    def __init__(self, filename, color='green', coordsys='image',
+                 chunksize=CHUNKSIZE):
+        self.filename = filename
+        self.chunksize = chunksize
+        self.file = open(filename, 'w', buffering=BUFSIZE)
+        self.file.write(HEADER.format(color))
+        self.file.write(coordsys + '\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, template, columns, color, comment):
+        '''Write one line per row of columns (a list of 1-d arrays, one per
+        '%r' in template), followed by the region comment'''
+        nlines = len(columns[0])
+        if color is None:
+            template = template + ' # ' + comment + '\n'
+        elif isinstance(color, str):
+            template = template + ' # color=' + color + ' ' + comment + '\n'
+        else:
+            template = template + ' # color=%s ' + comment + '\n'
+            color = np.asarray(color, dtype=object)
+            if len(color) != nlines:
+                raise ValueError('{} colours given for {} shapes'.format(len(color), nlines))
+            columns = list(columns) + [color]
+
+        # interleave the columns so that one % operation formats a whole chunk
+        if columns[-1].dtype == object:
+            values = np.empty((nlines, len(columns)), dtype=object)
+            for i, col in enumerate(columns):
+                values[:, i] = col if col.dtype == object else col.tolist()
+        else:
+            values = np.column_stack([np.asarray(col, np.float64) for col in columns])
+        for start in range(0, nlines, self.chunksize):
+            block = values[start:start + self.chunksize]
+            self.file.write((template * len(block)) % tuple(block.ravel().tolist()))
+
+    def polygons(self, x, y, color=None, text='{}'):
+        '''Closed polygons, x and y with shape (n_polygon, n_vertex)'''
+        x = np.atleast_2d(x)
+        y = np.atleast_2d(y)
+        nvertex = x.shape[1]
+        # polygon x1  y1  x2  y2  x3  y3 ...
+        template = 'polygon ' + '  '.join(['%r  %r'] * nvertex) + ' '
+        columns = []
+        for k in range(nvertex):
+            columns.append(x[:, k])
+            columns.append(y[:, k])
+        self._write(template, columns, color, 'text=' + text)
+
+    def points(self, x, y, color=None, point='cross', size=20):
+        '''Points of the given DS9 point shape and size'''
+        x = np.atleast_1d(x)
+        y = np.atleast_1d(y)
+        self._write('point(%10r,%10r)', [x, y], color,
+                    'point=' + point + ' ' + str(size))
+
+    def circles(self, x, y, radius=5, color=None, text='{}'):
+        '''Circles, radius in the units of the coordinate system'''
+        x = np.atleast_1d(x)
+        y = np.atleast_1d(y)
+        self._write('circle(%10r,%10r,' + str(radius) + ')', [x, y], color,
+                    'text=' + text)
+
+
+def write_polygons(filename, x, y, color='green', coordsys='image'):
+    '''Region file of polygons, x and y with shape (n_polygon, n_vertex)'''
+    with RegionFile(filename, color, coordsys) as reg:
+        reg.polygons(x, y)
+
+
+def write_points(filename, x, y, color='green', coordsys='image'):
+    '''Region file of cross points'''
+    with RegionFile(filename, color, coordsys) as reg:
+        reg.points(x, y)
+
+
+def write_circles(filename, x, y, color='yellow', coordsys='image', radius=5):
+    '''Region file of circles'''
+    with RegionFile(filename, color, coordsys) as reg:
+        reg.circles(x, y, radius)
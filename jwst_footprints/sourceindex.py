@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Spatial index over a source catalog, to find the sources that fall in each
+aperture (MSA quadrant, IFU, fixed slit, NIRCam detector) of a footprint.
+
+The sources are held as unit vectors in a k-d tree. An aperture polygon is
+queried by taking the sources within the chord distance of its farthest
+vertex from its centre, and keeping those on the inner side of every edge.
+
+    index = CatalogIndex.from_catalog('sources.radec')
+    geometry = compute_footprints(plot_msa='Yes', ra_msa=..., dec_msa=...)
+    inside = index.query_footprints(geometry)
+    inside['msa']['NRS_FULL_MSA1'][0]     # sources in quadrant 1, first dither
+
+footprint_membership() gives the same answer for a whole array of sources
+at once, as a (n_source, n_dither, n_aperture) boolean matrix.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from . import catalogs
+from .footprints import get_aperture, unit
+
+# sources per block of the membership matrix
+CHUNKSIZE = 65536
+
+
+def edge_normals(vertices):
+    '''Normals of the edge great circles of convex spherical polygons,
+    pointing to the inside. vertices are unit vectors (..., n_vertex, 3), the
+    normals have the same shape (zero for the closing edge of a closed polygon)'''
+    normals = np.cross(vertices, np.roll(vertices, -1, axis=-2))
+    inward = np.sign((normals * vertices.sum(axis=-2)[..., np.newaxis, :]).sum(axis=-1))
+    return normals * inward[..., np.newaxis]
+
+
+def inside_convex(xyz, vertices):
+    '''True for the unit vectors xyz (n, 3) inside the convex spherical
+    polygon with unit vector vertices (n_vertex, 3), closed or not'''
+    return (np.dot(xyz, edge_normals(vertices).T) >= 0.0).all(axis=1)
+
+
+def membership(ra, dec, polyra, polydec, chunksize=CHUNKSIZE):
+    '''Membership matrix of sources in convex polygons, degrees
+
+    ra, dec         : (n_source,) source positions
+    polyra, polydec : (..., n_vertex) polygon vertices, e.g. the (n_dither,
+                      n_aperture, 5) vertices of a footprint
+
+    Returns a boolean array (n_source, ...), True where the source is inside
+    the polygon. The sources are taken chunksize at a time against every
+    polygon, with one matrix product per vertex.'''
+    polyra = np.asarray(polyra, np.float64)
+    polydec = np.asarray(polydec, np.float64)
+    shape = polyra.shape[:-1]
+    nvertex = polyra.shape[-1]
+    vertices = np.moveaxis(unit(polyra.reshape(-1, nvertex),
+                                polydec.reshape(-1, nvertex)), 0, -1)
+    # (n_vertex, 3, n_polygon): one slab of edge normals per vertex
+    normals = np.ascontiguousarray(np.transpose(edge_normals(vertices), (1, 2, 0)))
+
+    ra = np.atleast_1d(np.asarray(ra, np.float64))
+    dec = np.atleast_1d(np.asarray(dec, np.float64))
+    inside = np.empty((len(ra), len(vertices)), bool)
+    for start in range(0, len(ra), chunksize):
+        xyz = unit(ra[start:start + chunksize], dec[start:start + chunksize]).T
+        block = inside[start:start + chunksize]
+        block[...] = True
+        for k in range(nvertex):
+            block &= np.dot(xyz, normals[k]) >= 0.0
+    return inside.reshape((len(ra),) + shape)
+
+
+def footprint_membership(ra, dec, fp):
+    '''membership() of sources in the apertures of a footprint fp from
+    compute_footprints(), a boolean array (n_source, n_dither, n_aperture).
+
+    inside.sum(axis=0) are the source counts per dither and aperture,
+    inside.any(axis=2).sum(axis=1) the number of dithers covering each source.'''
+    ndither = np.shape(fp['ra'])[0]
+    polyra = np.reshape(fp['ra'], (ndither, -1, 5))
+    polydec = np.reshape(fp['dec'], (ndither, -1, 5))
+    return membership(ra, dec, polyra, polydec)
+
+
+class CatalogIndex(object):
+    '''k-d tree over the unit vectors of the sources of a catalog
+
+    ra, dec    : source positions, degrees
+    sourcetype : optional source types (P, F) of the 3 column catalogs
+    xyz        : optional (n, 3) unit vectors of ra, dec, if already known
+
+    Queries return the indices of the sources in ra, dec, sorted.'''
+
+    def __init__(self, ra, dec, sourcetype=None, leafsize=16, xyz=None):
+        self.ra = np.asarray(ra, np.float64)
+        self.dec = np.asarray(dec, np.float64)
+        self.sourcetype = sourcetype
+        if xyz is None:
+            xyz = unit(self.ra, self.dec).T
+        self.xyz = np.ascontiguousarray(xyz)
+        self.tree = cKDTree(self.xyz, leafsize=leafsize)
+
+    @classmethod
+    def from_catalog(cls, filename, cache='Yes'):
+        '''Index of a 2 or 3 column .radec catalog file, read from its binary
+        copy when cache == 'Yes' (see catalogs.load_catalog())'''
+        if cache == 'Yes':
+            catalog = catalogs.load_catalog(filename)
+            return cls(catalog.ra, catalog.dec, catalog.sourcetype, xyz=catalog.xyz)
+        return cls(*catalogs.read_catalog(filename))
+
+    def __len__(self):
+        return len(self.ra)
+
+    def __repr__(self):
+        return '<CatalogIndex: %d sources>' % len(self)
+
+    def _ball(self, centre, chord):
+        return np.sort(np.asarray(self.tree.query_ball_point(centre, chord), np.intp))
+
+    def query_cap(self, ra, dec, radius):
+        '''Sources within radius degrees of (ra, dec)'''
+        chord = 2.0 * np.sin(np.radians(radius) / 2.0)
+        return self._ball(unit(ra, dec), chord)
+
+    def query_polygon(self, ra, dec):
+        '''Sources inside the convex polygon of vertices ra, dec (degrees)'''
+        vertices = unit(ra, dec).T
+        centre = vertices.sum(axis=0)
+        centre /= np.sqrt(np.dot(centre, centre))
+        chord = np.sqrt(((vertices - centre)**2).sum(axis=1)).max()
+        candidates = self._ball(centre, chord * (1.0 + 1e-9))
+        return candidates[inside_convex(self.xyz[candidates], vertices)]
+
+    def query_footprint(self, instrument, fp):
+        '''Sources in each aperture of the footprint fp of an instrument, from
+        compute_footprints(): dict aperture name -> list of index arrays,
+        one per dither position'''
+        names = get_aperture(instrument).names
+        ra = np.reshape(fp['ra'], (-1, len(names), 5))
+        dec = np.reshape(fp['dec'], (-1, len(names), 5))
+        inside = {}
+        for k, name in enumerate(names):
+            inside[name] = [self.query_polygon(ra[i, k], dec[i, k])
+                            for i in range(ra.shape[0])]
+        return inside
+
+    def query_footprints(self, geometry):
+        '''query_footprint() of every instrument of compute_footprints()'''
+        return dict((instrument, self.query_footprint(instrument, fp))
+                    for instrument, fp in geometry.items())
@@ -35,5 +35,8 @@ setup(
         'gui_scripts': [
             'jwst_footprints=jwst_footprints.gui.footprints:main',
         ],
+        'console_scripts': [
+            'jwst_footprints_batch=jwst_footprints.batch:main',
+        ],
     },
 )